@@ -13,16 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =================================================================
+import functools
 import os
 import pathlib
+import re
 from http import HTTPMethod
+from typing import Iterator
 
 import jsonschema
-from jsonschema import validate
+import orjson
+from jsonschema.exceptions import best_match
 from pygeoapi.api import *
 from pygeoapi.flask_app import CONFIG, OPENAPI
 from pygeoapi.provider.base import ProviderItemNotFoundError
-from pygeoapi.util import render_j2_template, to_json
 
 from meta import CSMeta
 from provider.definitions import *
@@ -31,12 +34,49 @@ from util import *
 
 package_dir = pathlib.Path(__file__).parent
 
+# valid identifier of an entity given in the path
+ENTITY_ID = re.compile(r"[\w-]+")
+
+
+# formats accepted per entity type, tuples so AsyncAPIRequest.is_valid can cache their values
+FEATURE_FORMATS = (ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON, ALLOWED_MIMES.F_GEOJSON)
+GEOJSON_FORMATS = (ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_GEOJSON)
+SML_FORMATS = (ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON)
+JSON_FORMATS = (ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_JSON)
+SCHEMA_FORMATS = (ALLOWED_MIMES.F_JSON,)
+
+# collections with more items are streamed in chunks instead of serialized as a single document
+STREAM_THRESHOLD = 1000
+STREAM_CHUNK_SIZE = 250
+
+
+def _stream_collection(head: bytes, items: List[Dict], links: List[Dict]) -> Iterator[bytes]:
+    """ Serializes a collection response in chunks of items, head opens the document up to the items array """
+    yield head
+    for start in range(0, len(items), STREAM_CHUNK_SIZE):
+        chunk = b','.join(dumps(item) for item in items[start:start + STREAM_CHUNK_SIZE])
+        yield b',' + chunk if start else chunk
+    yield b'],"links":' + dumps(links) + b'}'
+
+
+@functools.cache
+def _validator(location: str):
+    """
+    Loads and checks a schema once and returns a validator that can be reused for every request.
+    Cached per location, so all CSAPI instances of a process share the same validators.
+    """
+    with open(os.path.join(package_dir, location), 'rb') as definition:
+        schema = orjson.loads(definition.read())
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
 
 class CSAPI(CSMeta):
     """
         API Object implementing OGC API Connected Systems
     """
-    csa_schemas = {}
+    csa_validators = {}
     strict_validation = True
 
     def __init__(self, config, openapi):
@@ -62,8 +102,7 @@ class CSAPI(CSMeta):
                                        (EntityType.SAMPLING_FEATURES,
                                         "schemas/connected-systems/samplingFeature.schema"),
                                        (EntityType.DEPLOYMENTS, "schemas/connected-systems/deployment.schema")]:
-                    with open(os.path.join(package_dir, location), 'r') as definition:
-                        self.csa_schemas[name] = json.load(definition)
+                    self.csa_validators[name] = _validator(location)
             api_part2 = config['dynamic-resources'].get('connected-systems-api-part2', None)
 
             if api_part2 is not None:
@@ -77,35 +116,28 @@ class CSAPI(CSMeta):
                 for name, location in [
                     (EntityType.DATASTREAMS, "schemas/connected-systems/datastream.schema"),
                     (EntityType.OBSERVATIONS, "schemas/connected-systems/observation.schema")]:
-                    with open(os.path.join(package_dir, location), 'r') as definition:
-                        self.csa_schemas[name] = json.load(definition)
+                    self.csa_validators[name] = _validator(location)
 
     @parse_request
     @jsonldify
     async def get_collections(self,
                               request: AsyncAPIRequest,
                               template: Tuple[dict, int, str],
-                              original_format: str,
                               collection_id: str = None) -> APIResponse:
         """
-        Adds Connected-Systems collections to existing response
+        Adds Connected-Systems collections to existing response.
+        The template is requested from pygeoapi as json, the format of the client is taken from the request.
         """
-        # Start new response object if resources is empty, else reuse existing object
-        fcm = None
-        if template[1] == HTTPStatus.NOT_FOUND:
-            fcm = {"collections": [], "links": []}
-        else:
-            fcm = json.loads(template[2])
-
         # query collections
         data = None
         try:
+            request_params = request.params
             if collection_id is not None:
-                request.params['id'] = collection_id
+                request_params['id'] = collection_id
 
-            parameters = parse_query_parameters(CollectionParams(), request.params,
+            parameters = parse_query_parameters(CollectionParams(), request_params,
                                                 self.base_url + "/" + request.path_info)
-            parameters.format = original_format
+            parameters.format = request.format
             data = await self.provider_part1.query_collections(parameters)
         except ProviderItemNotFoundError:
             # element was not found in resources nor dynamic-resources, return 404
@@ -117,22 +149,29 @@ class CSAPI(CSMeta):
         if data:
             if collection_id is not None:
                 headers["Content-Type"] = "application/json"
-                return headers, HTTPStatus.OK, to_json(data[0][0], self.pretty_print)
+                return headers, HTTPStatus.OK, dumps(data[0][0], self.pretty_print)
             else:
+                # Start new response object if resources is empty, else reuse existing object
+                if template[1] == HTTPStatus.NOT_FOUND:
+                    fcm = {"collections": [], "links": []}
+                else:
+                    fcm = orjson.loads(template[2])
                 fcm['collections'].extend(data[0])
-                if original_format == F_HTML:  # render
+                if request.format == F_HTML:  # render
                     fcm['collections_path'] = f"{self.base_url}/collections"
                     headers["Content-Type"] = "text/html"
-                    content = render_j2_template(self.tpl_config,
-                                                 'collections/index.html',
-                                                 fcm,
-                                                 request.locale)
+                    content = self.render_template('collections/index.html',
+                                                   fcm,
+                                                   request.locale)
                     return headers, HTTPStatus.OK, content
                 else:
                     headers["Content-Type"] = "application/json"
-                    return headers, HTTPStatus.OK, to_json(fcm, self.pretty_print)
+                    return headers, HTTPStatus.OK, dumps(fcm, self.pretty_print)
 
-        return headers, HTTPStatus.OK, to_json(fcm, self.pretty_print)
+        if template[1] == HTTPStatus.NOT_FOUND:
+            return headers, HTTPStatus.OK, dumps({"collections": [], "links": []}, self.pretty_print)
+        # nothing to add, pass the existing response through without parsing and serializing it again
+        return headers, HTTPStatus.OK, template[2]
 
     @parse_request
     async def get_collection_items(self, request: AsyncAPIRequest, collection_id: str, item_id: str) -> APIResponse:
@@ -169,36 +208,36 @@ class CSAPI(CSMeta):
             case EntityType.SYSTEMS:
                 handler = self.provider_part1.query_systems
                 params = SystemsParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON, ALLOWED_MIMES.F_GEOJSON]
+                allowed_mimetypes = FEATURE_FORMATS
             case EntityType.DEPLOYMENTS:
                 handler = self.provider_part1.query_deployments
                 params = DeploymentsParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON, ALLOWED_MIMES.F_GEOJSON]
+                allowed_mimetypes = FEATURE_FORMATS
             case EntityType.PROCEDURES:
                 handler = self.provider_part1.query_procedures
                 params = ProceduresParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON, ALLOWED_MIMES.F_GEOJSON]
+                allowed_mimetypes = FEATURE_FORMATS
             case EntityType.SAMPLING_FEATURES:
                 handler = self.provider_part1.query_sampling_features
                 params = SamplingFeaturesParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_GEOJSON]
+                allowed_mimetypes = GEOJSON_FORMATS
             case EntityType.PROPERTIES:
                 handler = self.provider_part1.query_properties
                 params = CSAParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_SMLJSON]
+                allowed_mimetypes = SML_FORMATS
             case EntityType.DATASTREAMS:
                 handler = self.provider_part2.query_datastreams
                 params = DatastreamsParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_JSON]
+                allowed_mimetypes = JSON_FORMATS
             case EntityType.DATASTREAMS_SCHEMA:
                 handler = self.provider_part2.query_datastreams
                 params = DatastreamsParams()
                 params.schema = True
-                allowed_mimetypes = [ALLOWED_MIMES.F_JSON]
+                allowed_mimetypes = SCHEMA_FORMATS
             case EntityType.OBSERVATIONS:
                 handler = self.provider_part2.query_observations
                 params = ObservationsParams()
-                allowed_mimetypes = [ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_JSON]
+                allowed_mimetypes = JSON_FORMATS
 
         if allowed_mimetypes and not request.is_valid(allowed_mimetypes):
             # Check if mime_type is allowed
@@ -210,11 +249,12 @@ class CSAPI(CSMeta):
                 f"invalid mimetype supplied! expected {[f.value for f in allowed_mimetypes]} got '{request.format}'")
 
         headers = request.get_response_headers(**self.api_headers, force_type=request.format)
+        request_params = request.params
         collection = True
         # Expand parameters with additional information based on path
         if path is not None:
             # Check that id is not malformed.
-            if not re.match("^[\\w-]+$", path[1]):
+            if not ENTITY_ID.fullmatch(path[1]):
                 return self.get_exception(
                     HTTPStatus.BAD_REQUEST,
                     headers,
@@ -224,7 +264,7 @@ class CSAPI(CSMeta):
 
             # TODO: does the case exist where a property is specified both
             #  in url and query params and we overwrite stuff here?
-            request.params[path[0]] = path[1]
+            request_params[path[0]] = path[1]
 
             if path[0] == "id":
                 collection = False
@@ -233,7 +273,7 @@ class CSAPI(CSMeta):
             return self._format_html_response(request, headers, collection)
 
         try:
-            parameters = parse_query_parameters(params, request.params, self.base_url + "/" + request.path_info)
+            parameters = parse_query_parameters(params, request_params, self.base_url + "/" + request.path_info)
             parameters.format = request.format
             data = await handler(parameters)
 
@@ -314,22 +354,27 @@ class CSAPI(CSMeta):
             provider = self.provider_part1
 
         headers = request.get_response_headers(**self.api_headers)
-        entity = json.loads(request.data)
+        entity = orjson.loads(request.data)
+        if not isinstance(entity, dict):
+            return self.get_exception(
+                HTTPStatus.BAD_REQUEST,
+                headers,
+                request.format,
+                'InvalidParameterValue',
+                "Request body must be a single JSON object!")
 
         # Validate against json schema if required
         # may be turned off for increased performance
         if shall_validate:
-            schema = self.csa_schemas[collection]
-            try:
-                validate(instance=entity, schema=schema)
-
-            except jsonschema.exceptions.ValidationError as ex:
+            # best_match reports the same error jsonschema.validate would raise
+            error = best_match(self.csa_validators[collection].iter_errors(entity))
+            if error is not None:
                 return self.get_exception(
                     HTTPStatus.BAD_REQUEST,
                     headers,
                     request.format,
                     'InvalidParameterValue',
-                    ex.message)
+                    error.message)
         # remove additional fields that cannot be set using POST/PUT but only through Path but pass validation
         if "parent" in entity:
             return self.get_exception(
@@ -354,7 +399,7 @@ class CSAPI(CSMeta):
                 case _:
                     raise Exception(f"unrecognized HTTMethod {method}")
 
-            return headers, HTTPStatus.NO_CONTENT, to_json(await response, self.pretty_print)
+            return headers, HTTPStatus.NO_CONTENT, dumps(await response, self.pretty_print)
         except Exception as ex:
             return self.get_exception(
                 HTTPStatus.BAD_REQUEST,
@@ -377,10 +422,11 @@ class CSAPI(CSMeta):
             }
             if collection in ["subsystems", "datastreams", "deployments"]:
                 subcollection = None
-                if request.params.get("system"):
-                    subcollection = ("system", request.params.get("system"))
-                if request.params.get("parent"):
-                    subcollection = ("parent", request.params.get("parent"))
+                params = request.params
+                if system := params.get("system"):
+                    subcollection = ("system", system)
+                if parent := params.get("parent"):
+                    subcollection = ("parent", parent)
 
                 if subcollection:
                     data["config"][subcollection[0]] = subcollection[1]
@@ -410,30 +456,36 @@ class CSAPI(CSMeta):
                 "href": "?f=application/json"
             }
         ]
-        content = render_j2_template(self.tpl_config,
-                                     'templates/connected-systems/viewer.html',
-                                     data,
-                                     request.locale)
+        content = self.render_template('templates/connected-systems/viewer.html',
+                                       data,
+                                       request.locale)
         return headers, HTTPStatus.OK, content
 
     def _format_json_response(self, request, headers, data, is_collection: bool) -> APIResponse:
         if data is None:
             return headers, HTTPStatus.NOT_FOUND, ""
+        if is_collection and not self.pretty_print and len(data[0]) > STREAM_THRESHOLD:
+            if request.format == ALLOWED_MIMES.F_GEOJSON.value:
+                head = b'{"type":"FeatureCollection","features":['
+            else:
+                head = b'{"items":['
+            return headers, HTTPStatus.OK, _stream_collection(head, data[0], data[1])
+
         match request.format:
             case ALLOWED_MIMES.F_GEOJSON.value:
                 response = {
                     "type": "FeatureCollection",
-                    "features": [item for item in data[0]],
-                    "links": [link for link in data[1]],
+                    "features": data[0],
+                    "links": data[1],
                 } if is_collection else data[0][0]
-                return headers, HTTPStatus.OK, to_json(response, self.pretty_print)
+                return headers, HTTPStatus.OK, dumps(response, self.pretty_print)
             case _:
                 response = {
-                    "items": [item for item in data[0]],
-                    "links": [link for link in data[1]],
+                    "items": data[0],
+                    "links": data[1],
                 } if is_collection else data[0][0]
 
-                return headers, HTTPStatus.OK, to_json(response, self.pretty_print)
+                return headers, HTTPStatus.OK, dumps(response, self.pretty_print)
 
 
 PLUGINS["provider"]["toardb"] = "provider.toardb_csa.ToarDBProvider"
@@ -443,3 +495,6 @@ PLUGINS["provider"]["TimescaleDBConnectedSystems"] = \
     "provider.part2.timescaledb.ConnectedSystemsTimescaleDBProvider"
 
 csapi_ = CSAPI(CONFIG, OPENAPI)
+# landing, openapi, conformance and overview documents, they only change with the configuration
+documents_ = DocumentCache(csapi_.locales, CONFIG['server'].get('gzip', False),
+                           CONFIG['server'].get('encoding', 'utf-8'))
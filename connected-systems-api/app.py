@@ -13,27 +13,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =================================================================
+import asyncio
+import importlib
 import inspect
 import os.path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import orjson
 
 config = os.getenv("PYGEOAPI_CONFIG", "./pygeoapi-config.yml")
 oiconfig = os.getenv("PYGEOAPI_OPENAPI", "./openapi-config-csa.yml")
 os.environ["PYGEOAPI_CONFIG"] = config
 os.environ["PYGEOAPI_OPENAPI"] = oiconfig
 
-from quart import Quart, request, Request, make_response, send_from_directory
-from pygeoapi import flask_app
-from pygeoapi.flask_app import API_RULES, CONFIG, api_, OPENAPI
+from quart import Quart, request, Request, send_from_directory
+from pygeoapi.flask_app import API_RULES, CONFIG, api_
 from quart_cors import cors
 from werkzeug.datastructures import MultiDict
 
-from api import *
-from routes.edr import edr
-from routes.stac import stac
-from routes.collections import collections
-from routes.coverages import coverage
-from routes.csa import csa
-from routes.processes import oapip
+from api import csapi_, documents_
+from util import CompatibilityRequest, OrjsonProvider
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates/connected-systems/assets")
 
 
 # makes request args modifiable
@@ -41,81 +43,135 @@ class ModifiableRequest(Request):
     dict_storage_class = MultiDict
     parameter_storage_class = MultiDict
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # default for all routes that are not bound to a csa collection
+        self.collection = None
+
 
 class CustomQuart(Quart):
     request_class = ModifiableRequest
+    json_provider_class = OrjsonProvider
 
 
 APP = CustomQuart(__name__,
                   static_folder=os.path.join(os.path.dirname(inspect.getmodule(api_).__file__), "static"),
                   static_url_path='/static')
 
+
+def _env_list(name: str) -> list[str] | None:
+    value = os.environ.get(name)
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+# CORS settings are parsed into typed values once instead of handing raw strings to quart_cors
 APP.config['QUART_CORS_ALLOW_ORIGIN'] = os.environ.get("CORS_ALLOW_ORIGIN") or ""
-APP.config['QUART_CORS_ALLOW_CREDENTIALS'] = os.environ.get("CORS_ALLOW_CREDENTIALS")
-APP.config['QUART_CORS_ALLOW_METHODS'] = os.environ.get("CORS_ALLOW_METHODS")
-APP.config['QUART_CORS_ALLOW_HEADERS'] = os.environ.get("CORS_ALLOW_HEADERS")
-APP.config['QUART_CORS_EXPOSE_HEADERS'] = os.environ.get("CORS_EXPOSE_HEADERS")
-APP.config['QUART_CORS_MAX_AGE'] = os.environ.get("CORS_MAX_AGE")
+APP.config['QUART_CORS_ALLOW_CREDENTIALS'] = os.environ.get("CORS_ALLOW_CREDENTIALS", "").lower() in ("true", "1")
+APP.config['QUART_CORS_ALLOW_METHODS'] = _env_list("CORS_ALLOW_METHODS")
+APP.config['QUART_CORS_ALLOW_HEADERS'] = _env_list("CORS_ALLOW_HEADERS")
+APP.config['QUART_CORS_EXPOSE_HEADERS'] = _env_list("CORS_EXPOSE_HEADERS")
+# let browsers cache preflight responses for a day unless configured otherwise
+APP.config['QUART_CORS_MAX_AGE'] = int(os.environ.get("CORS_MAX_AGE") or 86400)
 
 APP = cors(APP)
 
 APP.url_map.strict_slashes = API_RULES.strict_slashes
-APP.config['JSONIFY_PRETTYPRINT_REGULAR'] = CONFIG['server'].get('pretty_print', False)
-
-APP.register_blueprint(csa)
+# Cache-Control max-age for /static and /assets, revalidation is handled via ETag/If-None-Match
+APP.config['SEND_FILE_MAX_AGE_DEFAULT'] = timedelta(days=1)
+if CONFIG['server'].get('pretty_print', False):
+    APP.json.option |= orjson.OPT_INDENT_2
+
+# blueprint name -> (module, attribute), modules are only imported if the blueprint is enabled
+_BLUEPRINTS = {
+    'csa': ('routes.csa', 'csa'),
+    'edr': ('routes.edr', 'edr'),
+    'stac': ('routes.stac', 'stac'),
+    'oapip': ('routes.processes', 'oapip'),
+    'coverage': ('routes.coverages', 'coverage'),
+    'collections': ('routes.collections', 'collections'),
+}
+
+_enabled_blueprints = CONFIG['server'].get('enabled_blueprints', _BLUEPRINTS.keys())
+_unknown_blueprints = [name for name in _enabled_blueprints if name not in _BLUEPRINTS]
+if _unknown_blueprints:
+    raise RuntimeError(f"unknown blueprints in server.enabled_blueprints: {', '.join(_unknown_blueprints)}, "
+                       f"valid blueprints are: {', '.join(_BLUEPRINTS)}")
+
+for name in _enabled_blueprints:
+    module, attribute = _BLUEPRINTS[name]
+    APP.register_blueprint(getattr(importlib.import_module(module), attribute))
 
-# TODO: make this configurable, only import required/configured
-APP.register_blueprint(edr)
-APP.register_blueprint(stac)
-APP.register_blueprint(oapip)
-APP.register_blueprint(coverage)
-APP.register_blueprint(collections)
 
-
-@APP.route('/')
 async def landing_page():
-    request.collection = ""
-    return await to_response(await csapi_.landing(request))
+    return await documents_.respond('landing', request, lambda: csapi_.landing(request))
 
 
-@APP.route('/assets/<path:filename>')
 async def assets(filename):
-    request.collection = None
-    return await send_from_directory("templates/connected-systems/assets", filename)
+    return await send_from_directory(ASSETS_DIR, filename)
 
 
-@APP.route('/openapi')
-def openapi():
-    request.collection = None
-    return flask_app.openapi()
+async def openapi():
+    return await documents_.respond(
+        'openapi', request,
+        lambda: asyncio.to_thread(api_.openapi_, CompatibilityRequest(None, request.headers, request.args)))
 
 
-@APP.route('/conformance')
 async def conformance():
-    request.collection = None
-    return await to_response(await csapi_.conformance(request))
+    return await documents_.respond('conformance', request, lambda: csapi_.conformance(request))
+
+
+_ROUTES = [
+    ('/', landing_page),
+    ('/assets/<path:filename>', assets),
+    ('/openapi', openapi),
+    ('/conformance', conformance),
+]
+
+for rule, view in _ROUTES:
+    APP.add_url_rule(rule, view_func=view)
+
+# Compile the url map once at import instead of lazily on the first request
+APP.url_map.update()
+
+
+def _providers():
+    return [p for p in (csapi_.provider_part1, csapi_.provider_part2) if p]
+
+
+# threads running the blocking pygeoapi calls, bounded so bursts of requests queue instead of spawning threads
+_MAX_THREADS = int(os.getenv('PYGEOAPI_MAX_THREADS', CONFIG['server'].get('max_threads', 32)))
+_executor: ThreadPoolExecutor | None = None
 
 
 @APP.before_serving
 async def init_db():
     """ Initialize persistent database/provider connections """
-    if csapi_.provider_part1:
-        await csapi_.provider_part1.open()
-    if csapi_.provider_part2:
-        await csapi_.provider_part2.open()
+    # quart runs sync views in its thread pool, all handlers are expected to be coroutine functions
+    sync_views = [endpoint for endpoint, view in APP.view_functions.items()
+                  if not inspect.iscoroutinefunction(view)]
+    if sync_views:
+        raise RuntimeError(f"synchronous view functions registered: {', '.join(sync_views)}")
+
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=_MAX_THREADS)
+    asyncio.get_running_loop().set_default_executor(_executor)
+    await asyncio.gather(*(p.open() for p in _providers()))
 
 
 @APP.after_serving
 async def close_db():
     """ Clean exit database/provider connections """
-    if csapi_.provider_part1:
-        await csapi_.provider_part1.close()
-    if csapi_.provider_part2:
-        await csapi_.provider_part2.close()
+    await asyncio.gather(*(p.close() for p in _providers()))
+    # the worker threads must not outlive the app on reload or teardown
+    if _executor is not None:
+        _executor.shutdown(wait=False)
 
 
 def run():
     ## Only used in local development - hypercorn is used for production
+    # run on the same event loop implementation as the hypercorn uvloop workers
+    import uvloop
+    uvloop.install()
     APP.run(debug=True,
             host=api_.config['server']['bind']['host'],
             port=api_.config['server']['bind']['port'])
@@ -1,12 +1,15 @@
 import logging
-from copy import deepcopy
+from functools import cached_property
 from http import HTTPStatus
 
-from pygeoapi import l10n
+from babel.support import Translations
+from jinja2 import ChoiceLoader, Environment, FileSystemLoader, select_autoescape
+from pygeoapi import __version__, l10n
 from pygeoapi.api import F_JSONLD, F_JSON, F_HTML, CHARSET, F_GZIP, SYSTEM_LOCALE, FORMAT_TYPES
 from pygeoapi.log import setup_logger
-from pygeoapi.util import render_j2_template, filter_dict_by_key_value, to_json, get_api_rules, get_base_url, \
-    UrlPrefetcher, TEMPLATES
+from pygeoapi.util import render_j2_template, filter_dict_by_key_value, get_api_rules, get_base_url, \
+    UrlPrefetcher, TEMPLATES, to_json, format_datetime, format_duration, human_size, get_path_basename, \
+    get_breadcrumbs
 
 from util import *
 from provider.definitions import *
@@ -14,6 +17,32 @@ from provider.definitions import *
 LOGGER = logging.getLogger(__name__)
 
 
+# formats the landing page links are kept for
+LANDING_FORMATS = frozenset((None, F_JSON, F_JSONLD, F_HTML))
+# media types the conformance document is provided in, besides the json default of pygeoapi
+CONFORMANCE_FORMATS = (ALLOWED_MIMES.F_HTML, ALLOWED_MIMES.F_JSON)
+
+_SML = ALLOWED_MIMES.F_SMLJSON
+_GEOJSON = ALLOWED_MIMES.F_GEOJSON
+_OM = ALLOWED_MIMES.F_OMJSON
+
+# endpoints listed on the connected systems overview page as (title, path, url encoded format, type)
+OVERVIEW_ENDPOINTS = (
+    ('Systems', 'systems', FORMAT_TYPES[F_JSON], F_JSON),
+    ('Systems', 'systems', _SML.url_value, _SML.value),
+    ('Systems', 'systems', _GEOJSON.url_value, _GEOJSON.value),
+    ('Procedures', 'procedures', _GEOJSON.url_value, _GEOJSON.value),
+    ('Procedures', 'procedures', _SML.url_value, _SML.value),
+    ('Deployments', 'deployments', _GEOJSON.url_value, _GEOJSON.value),
+    ('Deployments', 'deployments', _SML.url_value, _SML.value),
+    ('SamplingFeatures', 'samplingFeatures', _GEOJSON.url_value, _GEOJSON.value),
+    ('Properties', 'properties', _SML.url_value, _SML.value),
+    ('Datastreams', 'datastreams', F_JSON, F_JSON),
+    ('Observations', 'observations', _OM.url_value, _OM.value),
+    ('Observations', 'observations', _SML.url_value, ALLOWED_MIMES.F_SWEJSON.value),
+)
+
+
 class CSMeta:
     """
         Provides Meta information about the Connected-Systems API:
@@ -23,7 +52,7 @@ class CSMeta:
         - Overview-Page
     """
 
-    provider_part1: ConnectedSystemsPart1Provider | None
+    _provider_part1: ConnectedSystemsPart1Provider | None = None
     provider_part2: ConnectedSystemsPart2Provider | None
 
     def __init__(self, config, openapi):
@@ -61,8 +90,100 @@ class CSMeta:
         setup_logger(self.config['logging'])
 
         # Create config clone for HTML templating with modified base URL
-        self.tpl_config = deepcopy(self.config)
-        self.tpl_config['server']['url'] = self.base_url
+        # templates only read the config, so only the modified server section is copied
+        self.tpl_config = {**self.config, 'server': {**self.config['server'], 'url': self.base_url}}
+        self._landing_links_by_format = {}
+        self._template_environments = {}
+
+        # TODO: put title text in config or translatable files?
+        # static landing page links as (format, link), the rel of format specific links depends on the request
+        self._landing_links = [(F_JSON, {
+            'type': FORMAT_TYPES[F_JSON],
+            'title': 'This document as JSON',
+            'href': f"{self.base_url}?f={F_JSON}"
+        }), (F_JSONLD, {
+            'type': FORMAT_TYPES[F_JSONLD],
+            'title': 'This document as RDF (JSON-LD)',
+            'href': f"{self.base_url}?f={F_JSONLD}"
+        }), (F_HTML, {
+            'type': FORMAT_TYPES[F_HTML],
+            'title': 'This document as HTML',
+            'href': f"{self.base_url}?f={F_HTML}",
+            'hreflang': self.default_locale
+        }), (None, {
+            'rel': 'service-desc',
+            'type': 'application/vnd.oai.openapi+json;version=3.0',
+            'title': 'The OpenAPI definition as JSON',
+            'href': f"{self.base_url}/openapi"
+        }), (None, {
+            'rel': 'service-doc',
+            'type': FORMAT_TYPES[F_HTML],
+            'title': 'The OpenAPI definition as HTML',
+            'href': f"{self.base_url}/openapi?f={F_HTML}",
+            'hreflang': self.default_locale
+        }), (None, {
+            'rel': 'conformance',
+            'type': FORMAT_TYPES[F_JSON],
+            'title': 'Conformance',
+            'href': f"{self.base_url}/conformance"
+        }), (None, {
+            'rel': 'data',
+            'type': FORMAT_TYPES[F_JSON],
+            'title': 'Collections',
+            'href': f"{self.base_url}/collections"
+        })]
+
+        # endpoints listed on the connected systems overview page
+        self._overview_endpoints = [{
+            'title': title,
+            'href': f'{self.base_url}/{path}?f={format_}',
+            'type': type_,
+        } for title, path, format_, type_ in OVERVIEW_ENDPOINTS]
+
+    def _template_environment(self, locale: str) -> Tuple[Environment, dict]:
+        """
+        jinja2 environment and translated templating config of a locale, set up like render_j2_template does.
+        render_j2_template creates a new environment on every call, so each render compiles the template again.
+        Both only depend on the configuration, so they are created once per locale and the templates stay compiled.
+
+        :param locale: locale to render the templates in
+
+        :returns: tuple of environment and translated config
+        """
+        context = self._template_environments.get(locale)
+        if context is None:
+            env = Environment(
+                # templates missing in the configured path are taken from pygeoapi, like render_j2_template does
+                loader=ChoiceLoader([FileSystemLoader(self.tpl_config['server']['templates'].get('path', TEMPLATES)),
+                                     FileSystemLoader(TEMPLATES)]),
+                extensions=['jinja2.ext.i18n'],
+                autoescape=select_autoescape(['html', 'xml']),
+                # templates do not change at runtime, so their modification time is not checked on every render
+                auto_reload=False)
+            env.filters.update(to_json=to_json, format_datetime=format_datetime, format_duration=format_duration,
+                               human_size=human_size, get_path_basename=get_path_basename,
+                               get_breadcrumbs=get_breadcrumbs, filter_dict_by_key_value=filter_dict_by_key_value)
+            env.globals.update(to_json=to_json, get_path_basename=get_path_basename, get_breadcrumbs=get_breadcrumbs,
+                               filter_dict_by_key_value=filter_dict_by_key_value)
+            env.install_gettext_translations(Translations.load('locale', [locale]))
+            context = env, l10n.translate_struct(self.tpl_config, locale, True)
+            self._template_environments[locale] = context
+        return context
+
+    def render_template(self, template: str, data: dict, locale) -> bytes:
+        """
+        Renders a jinja2 template with the templating config.
+        The output is encoded once, so it can be sent as is.
+
+        :param template: path of the template
+        :param data: dict of data passed to the template
+        :param locale: locale to render the template in
+
+        :returns: encoded rendered template
+        """
+        env, config = self._template_environment(str(locale))
+        return env.get_template(template).render(config=config, data=data, locale=locale,
+                                                 version=__version__).encode(CHARSET[0])
 
     def get_exception(self, status, headers, format_, code,
                       description) -> Tuple[dict, int, str]:
@@ -93,7 +214,7 @@ class CSMeta:
             if headers is None:
                 headers = {}
             headers['Content-Type'] = FORMAT_TYPES[F_JSON]
-            content = to_json(exception, self.pretty_print)
+            content = dumps(exception, self.pretty_print)
 
         return headers, status, content
 
@@ -106,6 +227,10 @@ class CSMeta:
 
         :returns: tuple of headers, status code, content
         """
+        headers = request.get_response_headers(**self.api_headers)
+        return headers, HTTPStatus.OK, self._landing_content(request)
+
+    def _landing_content(self, request: AsyncAPIRequest) -> bytes:
         fcm = {
             'links': [],
             'title': l10n.translate(
@@ -117,76 +242,32 @@ class CSMeta:
                     request.locale)
         }
 
-        # TODO: put title text in config or translatable files?
-        fcm['links'] = [{
-            'rel': request.get_linkrel(F_JSON),
-            'type': FORMAT_TYPES[F_JSON],
-            'title': 'This document as JSON',
-            'href': f"{self.base_url}?f={F_JSON}"
-        }, {
-            'rel': request.get_linkrel(F_JSONLD),
-            'type': FORMAT_TYPES[F_JSONLD],
-            'title': 'This document as RDF (JSON-LD)',
-            'href': f"{self.base_url}?f={F_JSONLD}"
-        }, {
-            'rel': request.get_linkrel(F_HTML),
-            'type': FORMAT_TYPES[F_HTML],
-            'title': 'This document as HTML',
-            'href': f"{self.base_url}?f={F_HTML}",
-            'hreflang': self.default_locale
-        }, {
-            'rel': 'service-desc',
-            'type': 'application/vnd.oai.openapi+json;version=3.0',
-            'title': 'The OpenAPI definition as JSON',
-            'href': f"{self.base_url}/openapi"
-        }, {
-            'rel': 'service-doc',
-            'type': FORMAT_TYPES[F_HTML],
-            'title': 'The OpenAPI definition as HTML',
-            'href': f"{self.base_url}/openapi?f={F_HTML}",
-            'hreflang': self.default_locale
-        }, {
-            'rel': 'conformance',
-            'type': FORMAT_TYPES[F_JSON],
-            'title': 'Conformance',
-            'href': f"{self.base_url}/conformance"
-        }, {
-            'rel': 'data',
-            'type': FORMAT_TYPES[F_JSON],
-            'title': 'Collections',
-            'href': f"{self.base_url}/collections"
-        }]
+        fcm['links'] = self.landing_links(request)
 
-        headers = request.get_response_headers(**self.api_headers)
         if request.format == F_HTML:  # render
 
-            fcm['processes'] = False
-            fcm['stac'] = False
-            fcm['collection'] = False
-            fcm['connected-systems'] = False
+            fcm.update(self.resource_flags)
 
-            if filter_dict_by_key_value(self.config['resources'],
-                                        'type', 'process'):
-                fcm['processes'] = True
+            return self.render_template('templates/landing_page.html', fcm, request.locale)
 
-            if filter_dict_by_key_value(self.config['resources'],
-                                        'type', 'stac-collection'):
-                fcm['stac'] = True
+        return dumps(fcm, self.pretty_print)
 
-            if filter_dict_by_key_value(self.config['resources'],
-                                        'type', 'collection'):
-                fcm['collection'] = True
-
-            if filter_dict_by_key_value(self.config['dynamic-resources'],
-                                        'type', 'connected-systems'):
-                fcm['connected-systems'] = True
-                fcm['collection'] = True
+    def landing_links(self, request: AsyncAPIRequest) -> list:
+        """
+        Links of the landing page, the rel of the format specific links only depends on the requested format.
+        The links are built once for each of the landing page formats.
 
-            content = render_j2_template(self.tpl_config, 'templates/landing_page.html',
-                                         fcm, request.locale)
-            return headers, HTTPStatus.OK, content
+        :param request: A request object
 
-        return headers, HTTPStatus.OK, to_json(fcm, self.pretty_print)
+        :returns: list of links
+        """
+        links = self._landing_links_by_format.get(request.format)
+        if links is None:
+            links = [{'rel': request.get_linkrel(format_), **link} if format_ else link
+                     for format_, link in self._landing_links]
+            if request.format in LANDING_FORMATS:
+                self._landing_links_by_format[request.format] = links
+        return links
 
     @parse_request
     async def overview(self, request: AsyncAPIRequest) -> APIResponse:
@@ -198,7 +279,9 @@ class CSMeta:
         :returns: tuple of headers, status code, content
         """
         headers = request.get_response_headers(**self.api_headers)
+        return headers, HTTPStatus.OK, self._overview_content(request)
 
+    def _overview_content(self, request: AsyncAPIRequest) -> bytes:
         id_ = 'pygeoapi-csa'
         version = '0.0.1'
         url = f'{self.base_url}'
@@ -213,7 +296,7 @@ class CSMeta:
                 self.config['metadata']['identification']['description'],
                 request.locale),
             'links': [],
-            'endpoints': [],
+            'endpoints': self._overview_endpoints,
             'resources': [
                 {
                     "collection_name": "systems",
@@ -284,9 +367,9 @@ class CSMeta:
             ]
         }
 
-        collections = filter_dict_by_key_value(self.config['dynamic-resources'], 'type', 'connected-systems')
+        collections = self.connected_systems_resources
 
-        for key, value in collections.items():
+        for key in collections:
             content['links'].append({
                 'rel': 'child',
                 'href': f'{url}/{key}?f={F_JSON}',
@@ -298,102 +381,94 @@ class CSMeta:
                 'type': FORMAT_TYPES[F_HTML]
             })
 
-        content['endpoints'].append({
-            'title': f'Systems',
-            'href': f'{url}/systems?f={FORMAT_TYPES[F_JSON].replace("+", "%2B")}',
-            'type': F_JSON,
-        })
-
-        content['endpoints'].append({
-            'title': f'Systems',
-            'href': f'{url}/systems?f={ALLOWED_MIMES.F_SMLJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_SMLJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Systems',
-            'href': f'{url}/systems?f={ALLOWED_MIMES.F_GEOJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_GEOJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Procedures',
-            'href': f'{url}/procedures?f={ALLOWED_MIMES.F_GEOJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_GEOJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Procedures',
-            'href': f'{url}/procedures?f={ALLOWED_MIMES.F_SMLJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_SMLJSON.value,
-        })
-
-        content['endpoints'].append({
-            'title': f'Deployments',
-            'href': f'{url}/deployments?f={ALLOWED_MIMES.F_GEOJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_GEOJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Deployments',
-            'href': f'{url}/deployments?f={ALLOWED_MIMES.F_SMLJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_SMLJSON.value,
-        })
-
-        content['endpoints'].append({
-            'title': f'SamplingFeatures',
-            'href': f'{url}/samplingFeatures?f={ALLOWED_MIMES.F_GEOJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_GEOJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Properties',
-            'href': f'{url}/properties?f={ALLOWED_MIMES.F_SMLJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_SMLJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Datastreams',
-            'href': f'{url}/datastreams?f={F_JSON.replace("+", "%2B")}',
-            'type': F_JSON,
-        })
-        content['endpoints'].append({
-            'title': f'Observations',
-            'href': f'{url}/observations?f={ALLOWED_MIMES.F_OMJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_OMJSON.value,
-        })
-        content['endpoints'].append({
-            'title': f'Observations',
-            'href': f'{url}/observations?f={ALLOWED_MIMES.F_SMLJSON.value.replace("+", "%2B")}',
-            'type': ALLOWED_MIMES.F_SWEJSON.value,
-        })
-
         if request.format == F_HTML:  # render
-            content = render_j2_template(self.tpl_config,
-                                         'templates/connected-systems/overview.html',
-                                         content, request.locale)
-            return headers, HTTPStatus.OK, content
+            return self.render_template('templates/connected-systems/overview.html',
+                                        content, request.locale)
 
-        return headers, HTTPStatus.OK, to_json(content, self.pretty_print)
+        return dumps(content, self.pretty_print)
 
-    @parse_request
-    async def conformance(self, request: AsyncAPIRequest) -> APIResponse:
+    @cached_property
+    def connected_systems_resources(self) -> dict:
         """
-        Provide conformance definition
+        Connected systems resources of the configuration, which does not change at runtime
 
-        :param request: A request object
+        :returns: dict of dynamic resources with type connected-systems
+        """
+        return filter_dict_by_key_value(self.config['dynamic-resources'], 'type', 'connected-systems')
 
-        :returns: tuple of headers, status code, content
+    @cached_property
+    def resource_flags(self) -> dict:
         """
+        Resource types available in the configuration, used to render the landing page
+
+        :returns: dict of flags for processes, stac, collection and connected-systems
+        """
+        # types of all resources, collected in a single pass over the configuration
+        resource_types = {resource.get('type') for resource in (self.config['resources'] or {}).values()}
+        connected_systems = bool(self.connected_systems_resources)
+        return {
+            'processes': 'process' in resource_types,
+            'stac': 'stac-collection' in resource_types,
+            'collection': connected_systems or 'collection' in resource_types,
+            'connected-systems': connected_systems,
+        }
 
-        if not request.is_valid():
-            return self.get_format_exception(request)
+    @property
+    def provider_part1(self) -> ConnectedSystemsPart1Provider | None:
+        return self._provider_part1
 
+    @provider_part1.setter
+    def provider_part1(self, provider: ConnectedSystemsPart1Provider | None):
+        self._provider_part1 = provider
+        # conformance classes are collected from the provider, drop the ones of the previous provider
+        self.__dict__.pop('conformance_classes', None)
+        self.__dict__.pop('conformance_json', None)
+
+    @cached_property
+    def conformance_classes(self) -> dict:
+        """
+        Conformance classes implemented by the providers, these are static so they are only collected once
+
+        :returns: dict of conformance classes
+        """
         conformance_list = []
         if self.provider_part1:
             conformance_list = self.provider_part1.get_conformance()
-        conformance = {
-            'conformsTo': list(set(conformance_list))
+        # deduplicated in the order of the provider, so the document is byte stable
+        return {
+            'conformsTo': list(dict.fromkeys(conformance_list))
         }
 
+    @cached_property
+    def conformance_json(self) -> bytes:
+        """
+        Serialized conformance classes, cached together with the classes of the current provider
+
+        :returns: conformance document as JSON
+        """
+        return dumps(self.conformance_classes, self.pretty_print)
+
+    @parse_request
+    async def conformance(self, request: AsyncAPIRequest) -> APIResponse:
+        """
+        Provide conformance definition
+
+        :param request: A request object
+
+        :returns: tuple of headers, status code, content
+        """
+
+        if request.format not in (None, F_JSON) and not request.is_valid(CONFORMANCE_FORMATS):
+            return self.get_exception(
+                HTTPStatus.BAD_REQUEST,
+                {},
+                request.format,
+                'InvalidParameterValue',
+                f"invalid format supplied! expected {[f.value for f in CONFORMANCE_FORMATS]} got '{request.format}'")
+
         headers = request.get_response_headers(**self.api_headers)
         if request.format == F_HTML:  # render
-            content = render_j2_template(self.tpl_config, 'conformance.html',
-                                         conformance, str(request.locale))
+            content = self.render_template('conformance.html', self.conformance_classes, str(request.locale))
             return headers, HTTPStatus.OK, content
 
-        return headers, HTTPStatus.OK, to_json(conformance, self.pretty_print)
+        return headers, HTTPStatus.OK, self.conformance_json
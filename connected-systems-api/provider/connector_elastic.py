@@ -1,73 +1,213 @@
-import json
-import json
+import asyncio
+import base64
+import binascii
 import logging
+from http import HTTPStatus
 from typing import Union
 
+import orjson
 from elastic_transport import NodeConfig
-from elasticsearch_dsl import AsyncSearch
+from elasticsearch import ApiError
+from elasticsearch.helpers import async_bulk
+from elasticsearch_dsl import AsyncSearch, AsyncMultiSearch, Q
 from elasticsearch_dsl.async_connections import connections
-from pygeoapi.provider.base import ProviderConnectionError, ProviderItemNotFoundError
+from pygeoapi.provider.base import ProviderConnectionError, ProviderItemNotFoundError, ProviderInvalidDataError, \
+    ProviderGenericError, ProviderInvalidQueryError, ProviderQueryError
 
 from .definitions import *
 
 LOGGER = logging.getLogger(__name__)
-LOGGER.setLevel('DEBUG')
 
 
-def parse_datetime_params(query: AsyncSearch, parameters: DatetimeParam) -> AsyncSearch:
-    # Parse dateTime filter
-    if parameters.datetime_start() and parameters.datetime_end():
-        query = query.filter("range", validTime_parsed={"gte": parameters.datetime_start().isoformat(),
-                                                        "lte": parameters.datetime_end().isoformat()})
-    if parameters.datetime_start():
-        query = query.filter("range", validTime_parsed={"gte": parameters.datetime_start().isoformat()})
-    if parameters.datetime_end():
-        query = query.filter("range", validTime_parsed={"lte": parameters.datetime_end().isoformat()})
+def _log_query(query: AsyncSearch) -> None:
+    # only serialize the query if it is actually logged
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug(orjson.dumps(query.to_dict(), default=str, option=orjson.OPT_INDENT_2).decode())
+
+
+class QueryBuilder:
+    """
+    Collects the clauses of a search and applies them as a single bool query.
+    Every filter call on a search clones it, so the clauses are gathered first and the search is only copied once.
+    """
+    __slots__ = ("_filter", "_must", "_must_not")
+
+    def __init__(self):
+        self._filter = []
+        self._must = []
+        self._must_not = []
+
+    def filter(self, name: str, **params) -> "QueryBuilder":
+        self._filter.append(Q(name, **params))
+        return self
+
+    def query(self, name: str, **params) -> "QueryBuilder":
+        self._must.append(Q(name, **params))
+        return self
+
+    def exclude(self, name: str, **params) -> "QueryBuilder":
+        self._must_not.append(Q(name, **params))
+        return self
+
+    def build(self, search: AsyncSearch) -> AsyncSearch:
+        clauses = {k: v for k, v in (("filter", self._filter), ("must", self._must), ("must_not", self._must_not))
+                   if v}
+        return search.query("bool", **clauses) if clauses else search
+
+
+def _filter_range(query: QueryBuilder, field: str, start: DateTime | None, end: DateTime | None) -> QueryBuilder:
+    # both bounds go into a single range filter
+    bounds = {}
+    if start:
+        bounds["gte"] = start.isoformat()
+    if end:
+        bounds["lte"] = end.isoformat()
+    if bounds:
+        query.filter("range", **{field: bounds})
     return query
 
 
-def parse_csa_params(query: AsyncSearch, parameters: CSAParams) -> AsyncSearch:
+def parse_datetime_params(query: QueryBuilder, parameters: DatetimeParam) -> QueryBuilder:
+    # Parse dateTime filter
+    return _filter_range(query, "validTime_parsed", parameters.datetime_start(), parameters.datetime_end())
+
+
+def parse_csa_params(query: QueryBuilder, parameters: CSAParams) -> QueryBuilder:
+    # Applied before the other parse_* helpers, so the cheap and most selective id filter comes first
     # Parse id filter
     if parameters.id is not None:
-        query = query.filter("terms", _id=parameters.id)
+        query.filter("terms", _id=parameters.id)
     if parameters.q is not None:
-        query = query.query("multi_match", query=parameters.q, fields=["name", "description"])
+        query.query("multi_match", query=parameters.q, fields=["name", "description"])
     return query
 
 
-def parse_spatial_params(query: AsyncSearch,
+def parse_spatial_params(query: QueryBuilder,
                          parameters: Union[
-                             DeploymentsParams, SystemsParams, SamplingFeaturesParams, CollectionParams]) -> AsyncSearch:
+                             DeploymentsParams, SystemsParams, SamplingFeaturesParams, CollectionParams]) -> QueryBuilder:
     # Parse bbox filter
     if parameters.bbox is not None:
-        br = f"POINT ({parameters.bbox['y1']} {parameters.bbox['x2']})"
-        tl = f"POINT ({parameters.bbox['x1']} {parameters.bbox['y2']})"
-        query = query.filter("geo_bounding_box", position={"top_left": tl, "bottom_right": br})
+        bbox = parameters.bbox
+        # [lon, lat] arrays, so elasticsearch does not have to parse WKT points
+        query.filter("geo_bounding_box", position={"top_left": [bbox.min_x, bbox.max_y],
+                                                   "bottom_right": [bbox.max_x, bbox.min_y]})
     if parameters.geom is not None:
-        query = query.filter("geo_shape", position={"relation": "intersects", "shape": parameters.geom})
+        query.filter("geo_shape", position={"relation": "intersects", "shape": parameters.geom})
     return query
 
 
-def parse_temporal_filters(query: AsyncSearch, parameters: ObservationsParams | DatastreamsParams) -> AsyncSearch:
+def parse_temporal_filters(query: QueryBuilder, parameters: ObservationsParams | DatastreamsParams) -> QueryBuilder:
     # Parse resultTime filter
-    if parameters.resulttime_start() and parameters.resulttime_end():
-        query = query.filter("range", validTime_parsed={"gte": parameters.resulttime_start().isoformat(),
-                                                        "lte": parameters.resulttime_end().isoformat()})
-    if parameters.resulttime_start():
-        query = query.filter("range", validTime_parsed={"gte": parameters.resulttime_start().isoformat()})
-    if parameters.resulttime_end():
-        query = query.filter("range", validTime_parsed={"lte": parameters.resulttime_end().isoformat()})
-
+    _filter_range(query, "validTime_parsed", parameters.resulttime_start(), parameters.resulttime_end())
     # Parse phenomenonTime filter
-    if parameters.phenomenontime_start() and parameters.phenomenontime_end():
-        query = query.filter("range", validTime_parsed={"gte": parameters.phenomenontime_start().isoformat(),
-                                                        "lte": parameters.phenomenontime_end().isoformat()})
-    if parameters.phenomenontime_start():
-        query = query.filter("range", validTime_parsed={"gte": parameters.phenomenontime_start().isoformat()})
-    if parameters.phenomenontime_end():
-        query = query.filter("range", validTime_parsed={"lte": parameters.phenomenontime_end().isoformat()})
+    return _filter_range(query, "validTime_parsed", parameters.phenomenontime_start(),
+                         parameters.phenomenontime_end())
 
-    return query
+
+# Relevance first for text searches, the id keyword is the tiebreaker making the order total for search_after
+_PAGE_SORT = ("_score", "id")
+
+
+# parameters whose raw value may refer to the current time
+_TIME_PARAMETERS = ("datetime", "phenomenonTime", "resultTime")
+
+
+def _cacheable(parameters: CSAParams) -> bool:
+    # "now" is resolved to the current time, so such a request never hits the shard request cache again
+    return not any("now" in (getattr(parameters, key, None) or "") for key in _TIME_PARAMETERS)
+
+
+def _encode_cursor(sort_values: List) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(sort_values)).decode()
+
+
+def _decode_cursor(cursor: str) -> List:
+    try:
+        sort_values = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError):
+        sort_values = None
+    # a tampered cursor may still be valid JSON, elasticsearch expects one value per sort field
+    if not isinstance(sort_values, list) or len(sort_values) != len(_PAGE_SORT):
+        raise ProviderInvalidQueryError(user_msg=f"invalid value for parameter after: {cursor}")
+    return sort_values
+
+
+def _search_error(status: int | None, error: Dict | str) -> ProviderGenericError:
+    """
+    Maps the error of a failed search to the exception reported to the client, invalid queries are client errors
+    """
+    if isinstance(error, dict):
+        # the root cause names the offending part of the query, the top level reason is often 'all shards failed'
+        cause = (error.get("root_cause") or [error])[0]
+        error = cause.get("reason", cause.get("type"))
+    if status == HTTPStatus.BAD_REQUEST:
+        return ProviderInvalidQueryError(user_msg=error)
+    return ProviderQueryError(user_msg=error)
+
+
+class MultiSearchBatcher:
+    """
+    Coalesces searches submitted within a short window into a single multi search request.
+    A window of 0 collects the searches submitted until the event loop regains control, so single searches are not
+    delayed.
+    """
+    __slots__ = ("_flush_delay", "_max_batch", "_pending", "_tasks")
+
+    def __init__(self, flush_ms: float = 0, max_batch: int = 50):
+        self._flush_delay = flush_ms / 1000
+        self._max_batch = max_batch
+        self._pending = []
+        self._tasks = set()
+
+    async def execute(self, query: AsyncSearch) -> Dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif len(self._pending) == 1:
+            loop.call_later(self._flush_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            # keep a reference until the task is done, the event loop only holds weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _fail(batch, error: Exception) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    @staticmethod
+    async def _send(batch) -> None:
+        multi = AsyncMultiSearch()
+        for query, _ in batch:
+            multi = multi.add(query)
+        try:
+            # raw responses keep the error of each failed search, the dsl drops them
+            responses = (await connections.get_connection().msearch(searches=multi.to_dict()))["responses"]
+        except ApiError as e:
+            error = e.body.get("error", e.message) if isinstance(e.body, dict) else e.message
+            MultiSearchBatcher._fail(batch, _search_error(e.meta.status, error))
+            return
+        except Exception as e:
+            MultiSearchBatcher._fail(batch, e)
+            return
+
+        for (_, future), response in zip(batch, responses):
+            if future.done():
+                # the awaiting request was cancelled
+                continue
+            if "error" in response:
+                # a failed search only fails its own request
+                future.set_exception(_search_error(response.get("status"), response["error"]))
+            else:
+                future.set_result(response)
 
 
 @dataclass(frozen=True)
@@ -77,11 +217,21 @@ class ElasticSearchConfig:
     user: str
     password: str
     dbname: str
+    msearch_flush_ms: float = 0
+    connections_per_node: int = 32
 
 
 class ElasticsearchConnector:
+    # shared by all providers like the client itself
+    _batcher: MultiSearchBatcher = None
 
     async def connect_elasticsearch(self, config: ElasticSearchConfig) -> None:
+        try:
+            # the client is shared by all providers, only the first one to open creates it
+            connections.get_connection()
+            return
+        except KeyError:
+            pass
         LOGGER.debug(f'Connecting to Elasticsearch at: https://{config.hostname}:{config.port}/{config.dbname}')
         try:
             connections.create_connection(
@@ -95,40 +245,79 @@ class ElasticsearchConnector:
                 )],
                 timeout=20,
                 http_auth=(config.user, config.password),
+                # compress request and response bodies, observation pages can get large
+                http_compress=True,
+                # the client default of 10 connections caps the number of concurrent searches
+                connections_per_node=config.connections_per_node,
+                retry_on_timeout=True,
                 verify_certs=False)
+            ElasticsearchConnector._batcher = MultiSearchBatcher(config.msearch_flush_ms)
         except Exception as e:
             msg = f'Cannot connect to Elasticsearch: {e}'
             LOGGER.critical(msg)
             raise ProviderConnectionError(msg)
 
-    async def _exists(self, query: AsyncSearch) -> bool:
-        LOGGER.debug(json.dumps(query.to_dict(), indent=True, default=str))
-        return (await query.count()) > 0
+    async def close_elasticsearch(self) -> None:
+        try:
+            es = connections.get_connection()
+        except KeyError:
+            # already closed by another provider
+            return
+        connections.remove_connection("default")
+        ElasticsearchConnector._batcher = None
+        await es.close()
+
+    async def _exists(self, *queries: AsyncSearch) -> bool:
+        """
+        Checks whether any of the queries matches a document.
+        All queries are sent in a single multi search request, each stops at its first hit.
+        """
+        multi = AsyncMultiSearch()
+        for query in queries:
+            _log_query(query)
+            multi = multi.add(query.extra(size=0, terminate_after=1))
+        return any(response.hits.total.value > 0 for response in await multi.execute())
 
     async def search(self,
                      query: AsyncSearch,
                      parameters: CSAParams,
                      excludes=None) -> CSAGetResponse:
-        # Select appropriate strategy here: For collections >10k elements search_after must be used
+        # Deep pages are requested via search_after, from/size is limited to the first 10k elements
         if excludes is None:
             excludes = []
-        LOGGER.debug(json.dumps(query.to_dict(), indent=True, default=str))
 
-        found = (await query.source(excludes=excludes)[parameters.offset:parameters.offset+parameters.limit]
-                 .execute()).hits
+        query = query.source(excludes=excludes).sort(*_PAGE_SORT)
+        if parameters.after is not None:
+            # continue behind the last hit of the previous page, shards only have to collect a single page
+            query = query.extra(search_after=_decode_cursor(parameters.after))
+            offset = 0
+        else:
+            offset = parameters.offset
+        # one hit more than the page is fetched to decide on a next link, so hits do not have to be counted
+        query = query[offset:offset + parameters.limit + 1].extra(track_total_hits=False)
+        # the shard request cache only holds size=0 requests unless it is enabled per request
+        query = query.params(request_cache=_cacheable(parameters))
+        _log_query(query)
 
-        count = found.total.value
-        if count > 0:
+        batcher = self._batcher
+        if batcher is None:
+            raise ProviderConnectionError("Elasticsearch connection is not open")
+        # concurrent searches share a single multi search request, its raw response bodies are used directly as
+        # wrapping every hit into a Hit object is not needed to return the sources
+        hits = (await batcher.execute(query))["hits"]["hits"]
+
+        if hits:
             links = []
 
-            if count >= parameters.limit + parameters.offset:
+            if len(hits) > parameters.limit:
+                hits = hits[:parameters.limit]
                 links.append({
                     "title": "next",
                     "rel": "next",
-                    "href": parameters.nextlink()
+                    "href": parameters.nextlink(_encode_cursor(hits[-1]["sort"]))
                 })
 
-            return [h._source.to_dict() for h in found.hits], links
+            return [h["_source"] for h in hits], links
         else:
 
             # check if this query returns 404 or 200 with empty body in case of no return
@@ -137,21 +326,21 @@ class ElasticsearchConnector:
             else:
                 return [], []
 
-    # Creating multiple entities with one request is apparently not part of the spec anymore
-    # async def create_many(self, index: str, items: List[Tuple[str, Dict]]) -> CSACrudResponse:
-    #     routines = [None] * len(items)
-    #
-    #     for i, elem in enumerate(items):
-    #         identifier, item = elem
-    #         # add to ES if not already present
-    #         exists = await self._es.exists(index=index, id=identifier)
-    #         if exists.body:
-    #             raise ProviderInvalidDataError(user_msg='record already exists')
-    #         else:
-    #             routines[i] = self._es.index(index=index, id=identifier, document=item)
-    #
-    #     # wait for completion
-    #     await asyncio.gather(*routines)
-    #
-    #     # TODO: check if we need to validate something here
-    #     return [item[0] for item in items]
+    async def create_many(self, index: str, items: List[Tuple[str, Dict]], skip_existing: bool = False) -> List[str]:
+        """
+        Creates all items with a single bulk request and returns the identifiers of the created documents.
+        The create operation fails for documents that are already present, these are either skipped or
+        reported as invalid data.
+        """
+        actions = [{"_op_type": "create", "_index": index, "_id": identifier, "_source": item}
+                   for identifier, item in items]
+        _, errors = await async_bulk(connections.get_connection(), actions,
+                                     raise_on_error=False, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024)
+
+        failed = {error["create"]["_id"]: error["create"] for error in errors}
+        existing = [identifier for identifier, error in failed.items() if error["status"] == 409]
+        if len(existing) != len(failed):
+            raise ProviderGenericError(user_msg=f"cannot create items: {failed}")
+        if existing and not skip_existing:
+            raise ProviderInvalidDataError(user_msg=f"records already exist: {', '.join(existing)}")
+        return [identifier for identifier, _ in items if identifier not in failed]
@@ -14,12 +14,14 @@
 # limitations under the License.
 # =================================================================
 import dataclasses
+import functools
 import urllib.parse
 from dataclasses import dataclass
 from enum import Enum, auto
 from typing import List, Optional, Dict, Tuple, TypeAlias
 from datetime import datetime as DateTime
 
+from ciso8601 import parse_datetime
 from elasticsearch_dsl import AsyncDocument, Keyword, GeoShape, DateRange, InnerDoc
 from pygeoapi.provider.base import ProviderInvalidQueryError
 
@@ -41,13 +43,14 @@ class EntityType(Enum):
 
 @dataclass
 class CSAParams:
-    _parameters = ["f", "id", "q", "limit", "offset"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after"))
     _url: str = None
     f: str = "html"  # format
     id: List[str] = None
     q: Optional[List[str]] = None
     limit: int = 10
     offset: int = 0  # non-standard
+    after: Optional[str] = None  # non-standard, opaque cursor of the next page
 
     @property
     def format(self):
@@ -57,17 +60,53 @@ class CSAParams:
     def format(self, inp):
         self.f = inp
 
-    def nextlink(self) -> str:
-        values = {k: v for k, v in dataclasses.asdict(self).items() if v is not None and not k.startswith("_")}
-        values["offset"] += values["limit"]
+    def nextlink(self, after: Optional[str] = None) -> str:
+        # supplied query parameters in their wire format, so the link parses to the same parameters again
+        values = {}
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if value is not None and field.name in self._parameters:
+                values[field.name] = _query_value(value)
+        if after is None:
+            values["offset"] = self.offset + self.limit
+        else:
+            # the cursor points directly behind the current page
+            values["offset"] = 0
+            values["after"] = after
         return (self._url
                 + "?"
                 + urllib.parse.urlencode(values))
 
 
+@dataclass(slots=True, frozen=True)
+class BBox:
+    """ Bounding box with numeric coordinates, the altitude is only set for 3d boxes """
+    min_x: float  # Lower left corner, coordinate axis 1
+    min_y: float  # Lower left corner, coordinate axis 2
+    max_x: float  # Upper right corner, coordinate axis 1
+    max_y: float  # Upper right corner, coordinate axis 2
+    min_z: Optional[float] = None  # Minimum value, coordinate axis 3 (optional)
+    max_z: Optional[float] = None  # Maximum value, coordinate axis 3 (optional)
+
+
+def _query_value(value) -> str:
+    """
+    Serializes a parsed parameter back to its query string representation
+    """
+    if isinstance(value, BBox):
+        if value.min_z is None:
+            coordinates = (value.min_x, value.min_y, value.max_x, value.max_y)
+        else:
+            coordinates = (value.min_x, value.min_y, value.min_z, value.max_x, value.max_y, value.max_z)
+        return ",".join(map(str, coordinates))
+    if isinstance(value, list):
+        return ",".join(value)
+    return str(value)
+
+
 @dataclass
 class BBoxParam:
-    bbox: Optional[Dict] = None
+    bbox: Optional[BBox] = None
 
 
 @dataclass
@@ -116,14 +155,14 @@ class FoiObservedpropertyParam(CSAParams):
 
 @dataclass(slots=True)
 class CollectionParams(DatetimeParam, FoiObservedpropertyParam, CSAParams, BBoxParam, GeomParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "foi", "observedProperty", "bbox", "geom"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "foi", "observedProperty", "bbox", "geom"))
     pass
 
 
 @dataclass(slots=True)
 class SystemsParams(DatetimeParam, FoiObservedpropertyParam, BBoxParam, GeomParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "bbox", "foi", "observedProperty", "parent", "procedure",
-                   "controlledProperty", "geom"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "bbox", "foi", "observedProperty", "parent",
+                             "procedure", "controlledProperty", "geom"))
     parent: Optional[List[str]] = None
     procedure: Optional[List[str]] = None
     controlledProperty: Optional[List[str]] = None
@@ -131,36 +170,38 @@ class SystemsParams(DatetimeParam, FoiObservedpropertyParam, BBoxParam, GeomPara
 
 @dataclass(slots=True)
 class DeploymentsParams(DatetimeParam, FoiObservedpropertyParam, BBoxParam, GeomParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "bbox", "foi", "observedProperty", "system", "geom"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "bbox", "foi", "observedProperty", "system",
+                             "geom"))
     system: Optional[List[str]] = None
 
 
 @dataclass(slots=True)
 class ProceduresParams(DatetimeParam, FoiObservedpropertyParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "foi", "observedProperty", "controlledProperty"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "foi", "observedProperty",
+                             "controlledProperty"))
     controlledProperty: Optional[List[str]] = None
 
 
 @dataclass(slots=True)
 class SamplingFeaturesParams(DatetimeParam, FoiObservedpropertyParam, BBoxParam, GeomParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "bbox", "foi", "observedProperty", "controlledProperty", "system",
-                   "geom"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "bbox", "foi", "observedProperty",
+                             "controlledProperty", "system", "geom"))
     controlledProperty: Optional[List[str]] = None
     system: Optional[List[str]] = None
 
 
 @dataclass(slots=True)
 class DatastreamsParams(FoiObservedpropertyParam, ResulttimePhenomenontimeParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "foi", "observedProperty", "system", "phenomenonTime",
-                   "resultTime"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "after", "foi", "observedProperty", "system",
+                             "phenomenonTime", "resultTime"))
     system: Optional[List[str]] = None
     schema: Optional[bool] = None
 
 
 @dataclass(slots=True)
 class ObservationsParams(FoiObservedpropertyParam, ResulttimePhenomenontimeParam):
-    _parameters = ["f", "id", "q", "limit", "offset", "foi", "observedProperty", "datastream", "phenomenonTime",
-                   "resultTime"]
+    _parameters = frozenset(("f", "id", "q", "limit", "offset", "foi", "observedProperty", "datastream",
+                             "phenomenonTime", "resultTime"))
     datastream: Optional[str] = None
 
 
@@ -392,121 +433,101 @@ class ConnectedSystemsPart1Provider(ConnectedSystemsProvider):
         raise NotImplementedError()
 
 
-def parse_query_parameters(out_parameters: CSAParams, input_parameters: Dict, url: str):
+@functools.lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> DateTime:
     """
-    Parse parameter dict into usable/typed parameters
+    Parses an ISO 8601 timestamp with ciso8601, extended forms it does not support are parsed by the stdlib.
+    Results are cached as clients tend to repeat the same bounds, datetimes are immutable so they can be shared.
     """
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return DateTime.fromisoformat(value)
 
-    def _parse_list(identifier):
-        setattr(out_parameters,
-                identifier,
-                [elem for elem in input_parameters.get(identifier).split(",")])
 
-    def _verbatim(key):
-        setattr(out_parameters, key, input_parameters.get(key))
+def _parse_list(out_parameters: CSAParams, key: str, raw: str):
+    # duplicates are dropped in order, so the backends do not match the same value twice
+    setattr(out_parameters, key, list(dict.fromkeys(raw.split(","))))
 
-    def _parse_int(key):
-        setattr(out_parameters, key, int(input_parameters.get(key)))
 
-    def _parse_time(key):
-        val = input_parameters.get(key)
-        if "/" in val:
-            _parse_time_interval(key)
-        else:
-            # TODO: check if more edge cases/predefined variables exist
-            if val == "now":
-                date = DateTime.now()
-            else:
-                date = DateTime.fromisoformat(val)
-            setattr(out_parameters, key, (date, date))
-
-    def _parse_bbox(key):
-        split = input_parameters.get("bbox").split(',')
-        if len(split) == 4:
-            box = {
-                "type": "2d",
-                "x1": split[0],  # Lower left corner, coordinate axis 1
-                "x2": split[1],  # Lower left corner, coordinate axis 2
-                "y1": split[2],  # Upper right corner, coordinate axis 1
-                "y2": split[3]  # Upper right corner, coordinate axis 2
-            }
-        elif len(split) == 6:
-            box = {
-                "type": "3d",
-                "x1": split[0],  # Lower left corner, coordinate axis 1
-                "x2": split[1],  # Lower left corner, coordinate axis 2
-                "xalt": split[2],  # Minimum value, coordinate axis 3 (optional)
-                "y1": split[3],  # Upper right corner, coordinate axis 1
-                "y2": split[4],  # Upper right corner, coordinate axis 2
-                "yalt": split[5]  # Maximum value, coordinate axis 3 (optional)
-            }
-        else:
-            raise ProviderInvalidQueryError("invalid bbox")
-        setattr(out_parameters, "bbox", box)
-
-    def _parse_time_interval(key):
-        raw = input_parameters.get(key)
-        setattr(out_parameters, key, raw)
-        # TODO: Support 'latest' qualifier
-        now = DateTime.now()
-        start, end = None, None
-        if "/" in raw:
-            # time interval
-            split = raw.split("/")
-            startts = split[0]
-            endts = split[1]
-            if startts == "now":
-                start = now
-            elif startts == "..":
-                start = None
-            else:
-                start = DateTime.fromisoformat(startts)
-            if endts == "now":
-                end = now
-            elif endts == "..":
-                end = None
-            else:
-                end = DateTime.fromisoformat(endts)
-        else:
-            if raw == "now":
-                start = now
-                end = now
-            else:
-                ts = DateTime.fromisoformat(raw)
-                start = ts
-                end = ts
-        setattr(out_parameters, "_" + key, (start, end))
-
-    parser = {
-        "id": _parse_list,
-        "system": _parse_list,
-        "parent": _parse_list,
-        "q": _verbatim,
-        "observedProperty": _parse_list,
-        "procedure": _parse_list,
-        "controlledProperty": _parse_list,
-        "foi": _parse_list,
-        "format": _verbatim,
-        "f": _verbatim,
-        "limit": _parse_int,
-        "offset": _parse_int,
-        "bbox": _parse_bbox,
-        "datetime": _parse_time,
-        "geom": _verbatim,
-        "datastream": _verbatim,
-        "phenomenonTime": _parse_time_interval,
-        "resultTime": _parse_time_interval,
-    }
+def _verbatim(out_parameters: CSAParams, key: str, raw: str):
+    setattr(out_parameters, key, raw)
+
 
+def _parse_int(out_parameters: CSAParams, key: str, raw: str):
+    setattr(out_parameters, key, int(raw))
+
+
+def _parse_bbox(out_parameters: CSAParams, key: str, raw: str):
+    split = raw.split(',')
+    if len(split) == 4:
+        min_x, min_y, max_x, max_y = map(float, split)
+        box = BBox(min_x, min_y, max_x, max_y)
+    elif len(split) == 6:
+        min_x, min_y, min_z, max_x, max_y, max_z = map(float, split)
+        box = BBox(min_x, min_y, max_x, max_y, min_z, max_z)
+    else:
+        raise ProviderInvalidQueryError("invalid bbox")
+    setattr(out_parameters, "bbox", box)
+
+
+def _parse_time_token(token: str) -> DateTime | None:
+    # TODO: check if more edge cases/predefined variables exist
+    if token == "now":
+        return DateTime.now()
+    if token == "..":
+        return None
+    return _parse_timestamp(token)
+
+
+def _parse_time_interval(out_parameters: CSAParams, key: str, raw: str):
+    """
+    Parses an instant or an interval, the raw value is kept in key and the parsed (start, end) in _key
+    """
+    setattr(out_parameters, key, raw)
+    # TODO: Support 'latest' qualifier
+    if "/" in raw:
+        # time interval
+        startts, _, endts = raw.partition("/")
+        start, end = _parse_time_token(startts), _parse_time_token(endts)
+    else:
+        start = end = _parse_time_token(raw)
+    setattr(out_parameters, "_" + key, (start, end))
+
+
+# parser of each query parameter, built once at import instead of on every call of parse_query_parameters
+_PARSERS = {
+    "id": _parse_list,
+    "system": _parse_list,
+    "parent": _parse_list,
+    "q": _verbatim,
+    "observedProperty": _parse_list,
+    "procedure": _parse_list,
+    "controlledProperty": _parse_list,
+    "foi": _parse_list,
+    "format": _verbatim,
+    "f": _verbatim,
+    "limit": _parse_int,
+    "offset": _parse_int,
+    "after": _verbatim,
+    "bbox": _parse_bbox,
+    "datetime": _parse_time_interval,
+    "geom": _verbatim,
+    "datastream": _verbatim,
+    "phenomenonTime": _parse_time_interval,
+    "resultTime": _parse_time_interval,
+}
+
+
+def parse_query_parameters(out_parameters: CSAParams, input_parameters: Dict, url: str):
+    """
+    Parse parameter dict into usable/typed parameters
+    """
     out_parameters._url = url
-    #  TODO: There must be a way to make this more efficient/straightforward..
-    # Iterate possible parameters
     try:
-        for p in out_parameters._parameters:
-            # Check if parameter is supplied as input
-            if p in input_parameters:
-                # Parse value with appropriate mapping function
-                parser[p](p)
+        # Parse each supported parameter that is supplied as input with its mapping function
+        for p in out_parameters._parameters.intersection(input_parameters):
+            _PARSERS[p](out_parameters, p, input_parameters[p])
 
         return out_parameters
     except Exception as ex:
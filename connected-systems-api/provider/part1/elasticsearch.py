@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =================================================================
+import asyncio
 import logging
 import uuid
 from datetime import datetime as DateTime
@@ -20,12 +21,11 @@ import os
 
 
 import elasticsearch
-from elasticsearch_dsl import async_connections
 from elasticsearch_dsl.async_connections import connections
 from pygeoapi.provider.base import ProviderGenericError, ProviderItemNotFoundError
 
-from ..connector_elastic import ElasticsearchConnector, ElasticSearchConfig, parse_csa_params, parse_spatial_params, \
-    parse_datetime_params
+from ..connector_elastic import ElasticsearchConnector, ElasticSearchConfig, QueryBuilder, parse_csa_params, \
+    parse_spatial_params, parse_datetime_params
 from ..definitions import *
 
 LOGGER = logging.getLogger(__name__)
@@ -49,7 +49,10 @@ class ConnectedSystemsESProvider(ConnectedSystemsPart1Provider, ElasticsearchCon
             port=int(os.getenv('ELASTIC_PORT', provider_def['port'])),
             dbname=os.getenv('ELASTIC_DB', provider_def['dbname']),
             user=os.getenv('ELASTIC_USER', provider_def['user']),
-            password=os.getenv('ELASTIC_PASSWORD', provider_def['password'])
+            password=os.getenv('ELASTIC_PASSWORD', provider_def['password']),
+            msearch_flush_ms=float(os.getenv('ELASTIC_MSEARCH_FLUSH_MS', provider_def.get('msearch_flush_ms', 0))),
+            connections_per_node=int(os.getenv('ELASTIC_CONNECTIONS_PER_NODE',
+                                               provider_def.get('connections_per_node', 32)))
         )
 
     def get_conformance(self) -> List[str]:
@@ -64,23 +67,13 @@ class ConnectedSystemsESProvider(ConnectedSystemsPart1Provider, ElasticsearchCon
     async def setup(self):
         client = connections.get_connection()
 
-        if not await client.indices.exists(index=Collection.Index.name):
-            await Collection.init()
-        if not await client.indices.exists(index=System.Index.name):
-            await System.init()
-        if not await client.indices.exists(index=Deployment.Index.name):
-            await Deployment.init()
-        if not await client.indices.exists(index=Procedure.Index.name):
-            await Procedure.init()
-        if not await client.indices.exists(index=SamplingFeature.Index.name):
-            await SamplingFeature.init()
-        if not await client.indices.exists(index=Property.Index.name):
-            await Property.init()
+        documents = (Collection, System, Deployment, Procedure, SamplingFeature, Property)
+        exists = await asyncio.gather(*(client.indices.exists(index=d.Index.name) for d in documents))
+        await asyncio.gather(*(d.init() for d, e in zip(documents, exists) if not e))
         await self.__create_mandatory_collections()
 
     async def close(self):
-        es = async_connections.get_connection()
-        await es.close()
+        await self.close_elasticsearch()
 
     async def __create_mandatory_collections(self):
         # Create mandatory collections if not exists
@@ -200,21 +193,20 @@ class ConnectedSystemsESProvider(ConnectedSystemsPart1Provider, ElasticsearchCon
             }
         ]
 
-        for coll in mandatory:
-            if not await Collection.exists(id=coll["id"]):
-                c = Collection(**coll)
-                c.meta.id = coll["id"]
-                await c.save()
-
-            LOGGER.critical(f"creating mandatory collection {coll['id']}")
+        # collections that are already present are left untouched
+        created = await self.create_many(Collection.Index.name,
+                                         [(coll["id"], Collection(**coll).to_dict()) for coll in mandatory],
+                                         skip_existing=True)
+        for identifier in created:
+            LOGGER.critical(f"creating mandatory collection {identifier}")
 
     async def query_collections(self, parameters: CollectionParams) -> CSAGetResponse:
-        query = Collection().search()
+        query = QueryBuilder()
 
-        query = parse_csa_params(query, parameters)
-        query = parse_spatial_params(query, parameters)
+        parse_csa_params(query, parameters)
+        parse_spatial_params(query, parameters)
 
-        return await self.search(query, parameters)
+        return await self.search(query.build(Collection().search()), parameters)
 
     async def query_collection_items(self, collection_id: str, parameters: CSAParams) -> CSAGetResponse:
         # TODO: implement this for non-mandatory collections
@@ -235,76 +227,73 @@ class ConnectedSystemsESProvider(ConnectedSystemsPart1Provider, ElasticsearchCon
         return await self.search(query, parameters)
 
     async def query_systems(self, parameters: SystemsParams) -> CSAGetResponse:
-        query = System.search()
-
-        query = parse_datetime_params(query, parameters)
-        query = parse_csa_params(query, parameters)
-        query = parse_spatial_params(query, parameters)
+        query = QueryBuilder()
 
-        if parameters.geom is not None:
-            query = query.filter("geo_shape", position={"relation": "intersects", "shape": parameters.geom})
+        parse_csa_params(query, parameters)
+        parse_datetime_params(query, parameters)
+        # includes the geom filter
+        parse_spatial_params(query, parameters)
 
         # By default, only top level systems are included (i.e. subsystems are ommitted)
         # unless query parameter 'parent' or 'id' is set
         if parameters.parent is not None:
-            query = query.filter("terms", **{"parent": parameters.parent})
+            query.filter("terms", **{"parent": parameters.parent})
         else:
             pass
             # When requested as a collection
             if not parameters.id:
-                query = query.exclude("exists", field="parent")
+                query.exclude("exists", field="parent")
 
         for key in ["procedure", "foi", "observedProperty", "controlledProperty"]:
             prop = parameters.__getattribute__(key)
             if prop is not None:
-                query = query.filter("terms", **{key: prop})
+                query.filter("terms", **{key: prop})
 
-        return await self.search(query, parameters, ["validTime_parsed"])
+        return await self.search(query.build(System.search()), parameters, ["validTime_parsed"])
 
     async def query_deployments(self, parameters: DeploymentsParams) -> CSAGetResponse:
-        query = Deployment.search()
+        query = QueryBuilder()
 
-        query = parse_datetime_params(query, parameters)
-        query = parse_csa_params(query, parameters)
-        query = parse_spatial_params(query, parameters)
+        parse_csa_params(query, parameters)
+        parse_datetime_params(query, parameters)
+        parse_spatial_params(query, parameters)
 
         if parameters.system is not None:
-            query = query.filter("terms", system=parameters.system)
+            query.filter("terms", system=parameters.system)
 
-        return await self.search(query, parameters)
+        return await self.search(query.build(Deployment.search()), parameters)
 
     async def query_procedures(self, parameters: ProceduresParams) -> CSAGetResponse:
-        query = Procedure.search()
+        query = QueryBuilder()
 
-        query = parse_datetime_params(query, parameters)
-        query = parse_csa_params(query, parameters)
+        parse_csa_params(query, parameters)
+        parse_datetime_params(query, parameters)
 
         if parameters.controlledProperty is not None:
             # TODO: check if this is the correct property
-            query = query.filter("terms", controlledProperty=parameters.controlledProperty)
+            query.filter("terms", controlledProperty=parameters.controlledProperty)
 
-        return await self.search(query, parameters)
+        return await self.search(query.build(Procedure.search()), parameters)
 
     async def query_sampling_features(self, parameters: SamplingFeaturesParams) -> CSAGetResponse:
-        query = SamplingFeature.search()
+        query = QueryBuilder()
 
-        query = parse_datetime_params(query, parameters)
-        query = parse_csa_params(query, parameters)
+        parse_csa_params(query, parameters)
+        parse_datetime_params(query, parameters)
 
         if parameters.controlledProperty is not None:
             # TODO: check if this is the correct property
-            query = query.filter("terms", controlledProperty=parameters.controlledProperty)
+            query.filter("terms", controlledProperty=parameters.controlledProperty)
 
         if parameters.system is not None:
-            query = query.filter("terms", system=parameters.system)
+            query.filter("terms", system=parameters.system)
 
-        return await self.search(query, parameters)
+        return await self.search(query.build(SamplingFeature.search()), parameters)
 
     async def query_properties(self, parameters: CSAParams) -> CSAGetResponse:
-        query = Property.search()
-        query = parse_csa_params(query, parameters)
+        query = parse_csa_params(QueryBuilder(), parameters)
 
-        return await self.search(query, parameters)
+        return await self.search(query.build(Property.search()), parameters)
 
     async def create(self, type: EntityType, item: Dict) -> CSACrudResponse:
 
@@ -368,18 +357,10 @@ class ConnectedSystemsESProvider(ConnectedSystemsPart1Provider, ElasticsearchCon
                         error_msg = f"cannot delete system with nested resources and cascade=false. "
                         f"ref: /req/create-replace-delete/system"
 
-                        # TODO: Should we run all these checks in parallel or is it more efficient to sync + exit early?
-                        # check subsystems
-                        if await self._exists(System.search().filter("term", parent=identifier)):
-                            raise ProviderInvalidQueryError(user_msg=error_msg)
-
-                        # check deployments
-                        if await self._exists(Deployment.search().filter("term", system=identifier)):
-                            raise ProviderInvalidQueryError(user_msg=error_msg)
-
-                        # check sampling features
-                        if await self._exists(
-                                SamplingFeature.search().filter("term", system=identifier)):
+                        # check subsystems, deployments and sampling features in a single round trip
+                        if await self._exists(System.search().filter("term", parent=identifier),
+                                              Deployment.search().filter("term", system=identifier),
+                                              SamplingFeature.search().filter("term", system=identifier)):
                             raise ProviderInvalidQueryError(user_msg=error_msg)
 
                         entity = await System.get(identifier)
@@ -246,13 +246,13 @@ class ToarDBProvider(ConnectedSystemsPart1Provider):
             })
 
         links_json = []
-        if len(stations) == int(parameters.limit):
+        if len(stations) == parameters.limit:
             # page is fully filled - we assume a nextpage exists
             links_json.append({
                 "title": "next",
                 "href": f"{self.base_url}/samplingFeatures?"
                         f"limit={parameters.limit}"
-                        f"&offset={int(params['offset']) + int(parameters.limit)}"
+                        f"&offset={params['offset'] + parameters.limit}"
                         f"&f={parameters.format.replace('+', '%2B')}",
                 "rel": "next"
             })
@@ -363,13 +363,13 @@ class ToarDBProvider(ConnectedSystemsPart1Provider):
 
             # check if a nextPage exists and potentially add link
             links_json = []
-            if len(timeseries) == int(parameters.limit):
+            if len(timeseries) == parameters.limit:
                 # page is fully filled - we assume a nextpage exists
                 links_json.append({
                     "title": "next",
                     "href": f"{self.base_url}/datastreams?"
                             f"limit={parameters.limit}"
-                            f"&offset={int(params['offset']) + int(parameters.limit)}"
+                            f"&offset={params['offset'] + parameters.limit}"
                             f"&f={parameters.format}",
                     "rel": "next"
                 })
@@ -392,13 +392,13 @@ class ToarDBProvider(ConnectedSystemsPart1Provider):
         observations = [self._format_observation_om_json(obs) for obs in result]
 
         links_json = []
-        if len(observations) == int(parameters.limit):
+        if len(observations) == parameters.limit:
             # page is fully filled - we assume a nextpage exists
             links_json.append({
                 "title": "next",
                 "href": f"{nexturl}/observations?"
                         f"limit={parameters.limit}"
-                        f"&offset={int(params['offset']) + int(parameters.limit)}"
+                        f"&offset={params['offset'] + parameters.limit}"
                         f"&f={parameters.format}",
                 "rel": "next"
             })
@@ -550,13 +550,13 @@ class ToarDBProvider(ConnectedSystemsPart1Provider):
 
         # check if a nextPage exists and potentially add link
         links_json = []
-        if len(stations) == int(parameters.limit):
+        if len(stations) == parameters.limit:
             # page is fully filled - we assume a nextpage exists
             links_json.append({
                 "title": "next",
                 "href": f"{self.base_url}/systems?"
                         f"limit={parameters.limit}"
-                        f"&offset={int(params['offset']) + int(parameters.limit)}"
+                        f"&offset={params['offset'] + parameters.limit}"
                         f"&f={parameters.format}",
                 "rel": "next"
             })
@@ -581,14 +581,13 @@ class ToarDBProvider(ConnectedSystemsPart1Provider):
 
     def _parse_paging(self, parameters: CSAParams, parsed: Dict) -> None:
         parsed["limit"] = parameters.limit
-        parsed["offset"] = int(parameters.offset)
+        parsed["offset"] = parameters.offset
 
     def _parse_bbox(self, parameters: SystemsParams, parsed: Dict) -> None:
         if parameters.bbox is not None:
             # TODO: throw error on non-default bbox-crs
-            # TODO: throw error on invalid coordinates
-            coordinates = parameters.bbox.split(",")
-            parsed["bounding_box"] = ",".join(coordinates[:3])
+            bbox = parameters.bbox
+            parsed["bounding_box"] = f"{bbox.min_x},{bbox.min_y},{bbox.max_x},{bbox.max_y}"
 
-            if len(coordinates) > 4:
-                parsed["altitude"] = ",".join(coordinates[3:])
+            if bbox.min_z is not None:
+                parsed["altitude"] = f"{bbox.min_z},{bbox.max_z}"
@@ -1,5 +1,4 @@
 import functools
-import json
 import logging
 import uuid
 from http import HTTPStatus
@@ -10,12 +9,12 @@ import asyncpg
 import elasticsearch
 from asyncpg import Connection
 from elasticsearch import AsyncElasticsearch
-from elasticsearch_dsl import Search, AsyncSearch, async_connections, AsyncDocument, Keyword, AttrDict, Object
+from elasticsearch_dsl import Search, AsyncSearch, AsyncDocument, Keyword, AttrDict, Object
 from pygeoapi.provider.base import ProviderGenericError, ProviderItemNotFoundError
 
 from .formats.om_json_scalar import OMJsonSchemaParser
 from .util import TimescaleDbConfig, ObservationQuery, Observation
-from ..connector_elastic import ElasticsearchConnector, ElasticSearchConfig, parse_csa_params, \
+from ..connector_elastic import ElasticsearchConnector, ElasticSearchConfig, QueryBuilder, parse_csa_params, \
     parse_temporal_filters
 from ..definitions import *
 
@@ -70,6 +69,10 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
             user=os.getenv('TIMESCALEDB_USER', provider_def["timescale"]["user"]),
             password=os.getenv('TIMESCALEDB_PASSWORD', provider_def["timescale"]["password"]),
             dbname=os.getenv('TIMESCALEDB_DB', provider_def["timescale"]["dbname"]),
+            pool_min_size=int(os.getenv('TIMESCALEDB_POOL_MIN_SIZE',
+                                        provider_def["timescale"].get("pool_min_size", 10))),
+            pool_max_size=int(os.getenv('TIMESCALEDB_POOL_MAX_SIZE',
+                                        provider_def["timescale"].get("pool_max_size", 10))),
         )
 
         self._es_config = ElasticSearchConfig(
@@ -77,7 +80,11 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
             port=int(os.getenv('ELASTIC_PORT', provider_def["elastic"]["port"])),
             dbname=os.getenv('ELASTIC_DB', provider_def["elastic"]["dbname"]),
             user=os.getenv('ELASTIC_USER', provider_def["elastic"]["user"]),
-            password=os.getenv('ELASTIC_PASSWORD', provider_def["elastic"]["password"])
+            password=os.getenv('ELASTIC_PASSWORD', provider_def["elastic"]["password"]),
+            msearch_flush_ms=float(os.getenv('ELASTIC_MSEARCH_FLUSH_MS',
+                                             provider_def["elastic"].get("msearch_flush_ms", 0))),
+            connections_per_node=int(os.getenv('ELASTIC_CONNECTIONS_PER_NODE',
+                                               provider_def["elastic"].get("connections_per_node", 32))),
         )
         self.parser = OMJsonSchemaParser()
 
@@ -91,8 +98,7 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
 
     async def close(self):
         await self._pool.close()
-        es = async_connections.get_connection()
-        await es.close()
+        await self.close_elasticsearch()
 
     async def setup(self):
         ## Setup TimescaleDB
@@ -123,8 +129,8 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
         connection: Connection
         async with self._pool.acquire() as connection:
             async with connection.transaction():
-                for stmnt in statements:
-                    await connection.execute(stmnt)
+                # without arguments asyncpg uses the simple query protocol, sending all statements in one round trip
+                await connection.execute("\n".join(statements))
 
     def get_conformance(self) -> List[str]:
         """Returns the list of conformance classes that are implemented by this provider"""
@@ -287,14 +293,14 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
         :returns: dict of formatted properties
         """
 
-        query = Datastream.search()
-        query = parse_csa_params(query, parameters)
-        query = parse_temporal_filters(query, parameters)
+        query = QueryBuilder()
+        parse_csa_params(query, parameters)
+        parse_temporal_filters(query, parameters)
 
         if parameters.system is not None:
-            query = query.filter("terms", system=parameters.system)
+            query.filter("terms", system=parameters.system)
 
-        LOGGER.debug(json.dumps(query.to_dict(), indent=True, default=str))
+        query = query.build(Datastream.search())
         if parameters.schema:
             response = await self.search(query, parameters)
             return list(map(lambda x: x["schema"], response[0])), []
@@ -310,7 +316,7 @@ class ConnectedSystemsTimescaleDBProvider(ConnectedSystemsPart2Provider, Elastic
         response = await self._get_observations(parameters)
         if len(response) > 0:
             links = []
-            if len(response) == int(parameters.limit):
+            if len(response) == parameters.limit:
                 # page is fully filled - we assume a nextpage exists
                 url = self.base_url
                 if parameters.datastream:
@@ -1,3 +1,5 @@
+import asyncio
+
 from http import HTTPStatus
 
 from pygeoapi.util import filter_dict_by_key_value
@@ -9,11 +11,16 @@ from api import csapi_
 
 collections = Blueprint('collections', __name__)
 
+# media types that are only served by the Connected Systems API and never by pygeoapi collections
+CSA_ONLY_MIMES = frozenset((ALLOWED_MIMES.F_SMLJSON.value, ALLOWED_MIMES.F_OMJSON.value, ALLOWED_MIMES.F_SWEJSON.value))
+
+# collections served by pygeoapi as defined in 'resources', all other collections are dynamic via csapi
+PYGEOAPI_COLLECTIONS = frozenset(filter_dict_by_key_value(CONFIG['resources'], 'type', 'collection'))
+
 
 @collections.route('/collections')
 @collections.route('/collections/<path:collection_id>')
 async def all_collections(collection_id: str = None):
-    request.collection = None
     """
     OGC API collections endpoint
 
@@ -22,29 +29,30 @@ async def all_collections(collection_id: str = None):
     :returns: HTTP response
     """
 
-    format = None
-    if "f" in request.args:
-        format = request.args["f"]
+    args = request.args
 
     if collection_id:
-        if collection_id in filter_dict_by_key_value(CONFIG['resources'], 'type', 'collection'):
+        if collection_id in PYGEOAPI_COLLECTIONS:
             # The collection is defined in 'resources'
-            response = api_.describe_collections(CompatibilityRequest(None, request.headers, request.args),
-                                                 collection_id)
+            response = await asyncio.to_thread(api_.describe_collections,
+                                               CompatibilityRequest(None, request.headers, args),
+                                               collection_id)
         else:
             # The collection is dynamic via csapi
             response = await csapi_.get_collections(request,
                                                     ({}, HTTPStatus.NOT_FOUND, ""),
-                                                    format,
                                                     collection_id)
     else:
-        # Overwrite original request format with json so we can modify response later on and add CSAPI-entities
-        request.args["f"] = "json"
+        # Request json from pygeoapi so we can modify response later on and add CSAPI-entities.
+        # A copy is passed so the shared request args keep the original format
+        json_args = args.copy()
+        json_args["f"] = "json"
         body = await request.data
-        response = api_.describe_collections(CompatibilityRequest(body, request.headers, request.args))
+        response = await asyncio.to_thread(api_.describe_collections,
+                                           CompatibilityRequest(body, request.headers, json_args))
 
         # Add CSAPI-Collections to response
-        response = await csapi_.get_collections(request, response, format)
+        response = await csapi_.get_collections(request, response)
 
     return await to_response(response)
 
@@ -52,14 +60,19 @@ async def all_collections(collection_id: str = None):
 @collections.route('/collections/<path:collection_id>/items')
 @collections.route('/collections/<path:collection_id>/items/<path:item_id>')
 async def collection_items(collection_id: str, item_id: str = None):
-    request.collection = None
+
+    # Skip the lookup in 'resources' if the client negotiates a media type only csapi can serve
+    csa_only = (request.args.get("f") in CSA_ONLY_MIMES
+                or request.accept_mimetypes.best in CSA_ONLY_MIMES)
 
     # Resource is configured via 'resources'
-    if collection_id in filter_dict_by_key_value(CONFIG['resources'], 'type', 'collection'):
+    if not csa_only and collection_id in PYGEOAPI_COLLECTIONS:
+        # the request context is only available on the event loop, the worker thread gets a plain copy
+        compat = CompatibilityRequest(None, request.headers, request.args)
         if item_id:
-            response = api_.get_collection_item(request, collection_id, item_id)
+            response = await asyncio.to_thread(api_.get_collection_item, compat, collection_id, item_id)
         else:
-            response = api_.get_collection_items(request, collection_id)
+            response = await asyncio.to_thread(api_.get_collection_items, compat, collection_id)
     else:
         # Resource is dynamic via csapi
         response = await csapi_.get_collection_items(request, collection_id, item_id)
@@ -76,7 +89,7 @@ async def collection_schema(collection_id):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_schema(compat, collection_id))
+    return await to_response(await asyncio.to_thread(api_.get_collection_schema, compat, collection_id))
 
 
 @collections.route('/collections/<path:collection_id>/queryables')
@@ -89,7 +102,7 @@ async def collection_queryables(collection_id=None):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_queryables(compat, collection_id))
+    return await to_response(await asyncio.to_thread(api_.get_collection_queryables, compat, collection_id))
 
 
 @collections.route('/collections/<path:collection_id>/tiles')
@@ -102,8 +115,7 @@ async def get_collection_tiles(collection_id=None):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_tiles(
-        compat, collection_id))
+    return await to_response(await asyncio.to_thread(api_.get_collection_tiles, compat, collection_id))
 
 
 @collections.route('/collections/<path:collection_id>/tiles/<tileMatrixSetId>')
@@ -118,8 +130,8 @@ async def get_collection_tiles_metadata(collection_id=None, tileMatrixSetId=None
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_tiles_metadata(
-        compat, collection_id, tileMatrixSetId))
+    return await to_response(await asyncio.to_thread(api_.get_collection_tiles_metadata,
+                                                     compat, collection_id, tileMatrixSetId))
 
 
 @collections.route('/collections/<path:collection_id>/tiles/\
@@ -138,8 +150,9 @@ async def get_collection_tiles_data(collection_id=None, tileMatrixSetId=None,
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_tiles_data(
-        compat, collection_id, tileMatrixSetId, tileMatrix, tileRow, tileCol))
+    return await to_response(await asyncio.to_thread(api_.get_collection_tiles_data,
+                                                     compat, collection_id, tileMatrixSetId,
+                                                     tileMatrix, tileRow, tileCol))
 
 
 @collections.route('/collections/<collection_id>/map')
@@ -153,13 +166,5 @@ async def collection_map(collection_id, style_id=None):
 
     :returns: HTTP response
     """
-
-    headers, status_code, content = api_.get_collection_map(
-        request, collection_id, style_id)
-
-    response = make_response(content, status_code)
-
-    if headers:
-        response.headers = headers
-
-    return response
+    compat = CompatibilityRequest(None, request.headers, request.args)
+    return await to_response(await asyncio.to_thread(api_.get_collection_map, compat, collection_id, style_id))
@@ -1,3 +1,5 @@
+import asyncio
+
 from quart import request, Blueprint
 
 from pygeoapi.flask_app import api_
@@ -15,4 +17,4 @@ async def collection_coverage(collection_id):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_collection_coverage(compat, collection_id))
+    return await to_response(await asyncio.to_thread(api_.get_collection_coverage, compat, collection_id))
@@ -1,130 +1,84 @@
 from quart import request, Blueprint
 
-from pygeoapi.flask_app import api_, CONFIG, OPENAPI
 from util import *
 from provider.definitions import *
-from api import csapi_
+from api import csapi_, documents_
 
 csa = Blueprint('csa', __name__)
 
+# bound once so handlers skip the attribute lookup on csapi_ per request
+_get, _post, _put, _patch, _delete = csapi_.get, csapi_.post, csapi_.put, csapi_.patch, csapi_.delete
+
 
-@csa.route('/connected-systems/')
 async def csa_catalog_root():
-    request.collection = None
     """
     Connected Systems API root endpoint
 
     :returns: HTTP response
     """
-    return await to_response(await csapi_.overview(request))
-
-
-@csa.route('/systems', methods=['GET', 'POST'])
-@csa.route('/systems/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def systems_path(path=None):
-    request.collection = "systems"
-    return await _default_handler(path, EntityType.SYSTEMS)
-
-
-@csa.route('/systems/<path:path>/subsystems', methods=['GET', 'POST'])
-@csa.route('/systems/<path:path>/deployments', methods=['GET'])
-@csa.route('/systems/<path:path>/samplingFeatures', methods=['GET', 'POST'])
-@csa.route('/systems/<path:path>/datastreams', methods=['GET', 'POST'])
-async def systems_subpath(path=None):
-    collection = request.path.split('/')[-1]
-    request.collection = collection
-    if request.method == 'GET':
-        match collection:
-            case "subsystems":
-                return await to_response(await csapi_.get(request, EntityType.SYSTEMS, ("parent", path)))
-            case "deployments":
-                return await to_response(await csapi_.get(request, EntityType.DEPLOYMENTS, ("system", path)))
-            case "samplingFeatures":
-                return await to_response(await csapi_.get(request, EntityType.SAMPLING_FEATURES, ("system", path)))
-            case "datastreams":
-                return await to_response(await csapi_.get(request, EntityType.DATASTREAMS, ("system", path)))
-    elif request.method == 'POST':
-        match collection:
-            case "subsystems":
-                return await to_response(await csapi_.post(request, EntityType.SYSTEMS, ("parent", path)))
-            case "samplingFeatures":
-                return await to_response(await csapi_.post(request, EntityType.SAMPLING_FEATURES, ("system", path)))
-            case "datastreams":
-                return await to_response(await csapi_.post(request, EntityType.DATASTREAMS, ("system", path)))
-
-
-@csa.route('/procedures', methods=['GET', 'POST'])
-@csa.route('/procedures/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def procedures_path(path=None):
-    request.collection = "procedures"
-    return await _default_handler(path, EntityType.PROCEDURES)
-
-
-@csa.route('/deployments', methods=['GET', 'POST'])
-@csa.route('/deployments/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def deployments_path(path=None):
-    request.collection = "deployments"
-    return await _default_handler(path, EntityType.DEPLOYMENTS)
-
-
-@csa.route('/samplingFeatures', methods=['GET'])
-@csa.route('/samplingFeatures/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def properties_path(path=None):
-    request.collection = "samplingFeatures"
-    return await _default_handler(path, EntityType.SAMPLING_FEATURES)
+    return await documents_.respond('overview', request, lambda: csapi_.overview(request))
 
 
-@csa.route('/properties', methods=['GET', 'POST'])
-@csa.route('/properties/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def properties_subpath(path=None):
-    request.collection = "properties"
-    return await _default_handler(path, EntityType.PROPERTIES)
-
-
-@csa.route('/datastreams', methods=['GET'])
-@csa.route('/datastreams/<path:path>', methods=['GET', 'PATCH', 'PUT', 'DELETE'])
-async def datastreams_path(path=None):
-    request.collection = "datastreams"
-    return await _default_handler(path, EntityType.DATASTREAMS)
-
-
-async def _default_handler(path, entity_type):
-    match request.method:
-        case "GET":
-            if path is not None:
-                return await to_response(await csapi_.get(request, entity_type, ("id", path)))
-            else:
-                return await to_response(await csapi_.get(request, entity_type))
-        case "PATCH":
-            return await to_response(await csapi_.patch(request, entity_type, ("id", path)))
-        case "POST":
-            return await to_response(await csapi_.post(request, entity_type))
-        case "PUT":
-            return await to_response(await csapi_.put(request, entity_type, ("id", path)))
-        case "DELETE":
-            return await to_response(await csapi_.delete(request, entity_type, ("id", path)))
-
-
-@csa.route('/datastreams/<path:path>/schema', methods=['GET', 'PUT'])
-async def datastreams_schema(path=None):
-    request.collection = "schema"
-    if request.method == 'GET':
-        return await to_response(await csapi_.get(request, EntityType.DATASTREAMS_SCHEMA, ("id", path)))
-    else:
-        return await to_response(await csapi_.put(request, EntityType.DATASTREAMS_SCHEMA, ("id", path)))
+def _entity_view(handler, collection, entity_type, path_key=None):
+    """
+    Creates the view of a single method on a csa resource.
+    Each method is routed to its own view, so the handler, collection and lookup are bound once at import
+    instead of being dispatched on the request method and path per request.
 
+    :param handler: csapi_ method handling the request
+    :param collection: name of the collection set on the request
+    :param entity_type: type of the entities in the collection
+    :param path_key: name of the property the path parameter is matched against, None if the rule has no path
 
-@csa.route('/datastreams/<path:path>/observations', methods=['GET', 'POST'])
-async def datastreams_observations(path=None):
-    request.collection = "observations"
-    if request.method == 'GET':
-        return await to_response(await csapi_.get(request, EntityType.OBSERVATIONS, ("datastream", path)))
+    :returns: view function
+    """
+    if path_key is None:
+        async def view():
+            request.collection = collection
+            return await to_response(await handler(request, entity_type))
     else:
-        return await to_response(await csapi_.post(request, EntityType.OBSERVATIONS, ("datastream", path)))
-
-
-@csa.route('/observations', methods=['GET'])
-@csa.route('/observations/<path:path>', methods=['GET', 'PUT', 'DELETE'])
-async def observations_path(path=None):
-    request.collection = "observations"
-    return await _default_handler(path, EntityType.OBSERVATIONS)
+        async def view(path):
+            request.collection = collection
+            return await to_response(await handler(request, entity_type, (path_key, path)))
+    return view
+
+
+_HANDLERS = {'GET': _get, 'POST': _post, 'PUT': _put, 'PATCH': _patch, 'DELETE': _delete}
+
+# rules of the csa resources as (rule, methods, collection, entity type, key of the path parameter)
+_RESOURCES = [
+    ('/systems', ['GET', 'POST'], "systems", EntityType.SYSTEMS, None),
+    ('/systems/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "systems", EntityType.SYSTEMS, "id"),
+    ('/systems/<path:path>/subsystems', ['GET', 'POST'], "subsystems", EntityType.SYSTEMS, "parent"),
+    ('/systems/<path:path>/deployments', ['GET'], "deployments", EntityType.DEPLOYMENTS, "system"),
+    ('/systems/<path:path>/samplingFeatures', ['GET', 'POST'], "samplingFeatures", EntityType.SAMPLING_FEATURES,
+     "system"),
+    ('/systems/<path:path>/datastreams', ['GET', 'POST'], "datastreams", EntityType.DATASTREAMS, "system"),
+    ('/procedures', ['GET', 'POST'], "procedures", EntityType.PROCEDURES, None),
+    ('/procedures/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "procedures", EntityType.PROCEDURES, "id"),
+    ('/deployments', ['GET', 'POST'], "deployments", EntityType.DEPLOYMENTS, None),
+    ('/deployments/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "deployments", EntityType.DEPLOYMENTS, "id"),
+    ('/samplingFeatures', ['GET'], "samplingFeatures", EntityType.SAMPLING_FEATURES, None),
+    ('/samplingFeatures/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "samplingFeatures",
+     EntityType.SAMPLING_FEATURES, "id"),
+    ('/properties', ['GET', 'POST'], "properties", EntityType.PROPERTIES, None),
+    ('/properties/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "properties", EntityType.PROPERTIES, "id"),
+    ('/datastreams', ['GET'], "datastreams", EntityType.DATASTREAMS, None),
+    ('/datastreams/<path:path>', ['GET', 'PATCH', 'PUT', 'DELETE'], "datastreams", EntityType.DATASTREAMS, "id"),
+    ('/datastreams/<path:path>/schema', ['GET', 'PUT'], "schema", EntityType.DATASTREAMS_SCHEMA, "id"),
+    ('/datastreams/<path:path>/observations', ['GET', 'POST'], "observations", EntityType.OBSERVATIONS,
+     "datastream"),
+    ('/observations', ['GET'], "observations", EntityType.OBSERVATIONS, None),
+    ('/observations/<path:path>', ['GET', 'PUT', 'DELETE'], "observations", EntityType.OBSERVATIONS, "id"),
+]
+
+# All rules are added in a single pass, the url map is compiled once after registration in app.py
+csa.add_url_rule('/connected-systems/', view_func=csa_catalog_root, methods=['GET'])
+
+for rule, methods, collection, entity_type, path_key in _RESOURCES:
+    endpoint = rule.strip('/').replace('<path:path>', 'item').replace('/', '_')
+    for method in methods:
+        csa.add_url_rule(rule,
+                         endpoint=f"{method.lower()}_{endpoint}",
+                         view_func=_entity_view(_HANDLERS[method], collection, entity_type, path_key),
+                         methods=[method])
@@ -1,3 +1,5 @@
+import asyncio
+
 from quart import request, Blueprint
 
 from pygeoapi.flask_app import api_
@@ -38,6 +40,7 @@ async def get_collection_edr_query(collection_id, instance_id=None, location_id=
     else:
         query_type = request.path.split('/')[-1]
 
-    return await to_response(api_.get_collection_edr_query(compat, collection_id,
-                                                           instance_id, query_type,
-                                                           location_id))
+    return await to_response(await asyncio.to_thread(api_.get_collection_edr_query,
+                                                     compat, collection_id,
+                                                     instance_id, query_type,
+                                                     location_id))
@@ -1,3 +1,5 @@
+import asyncio
+
 from quart import Blueprint, request
 
 from pygeoapi.flask_app import api_
@@ -17,7 +19,7 @@ async def get_processes(process_id=None):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.describe_processes(compat, process_id))
+    return await to_response(await asyncio.to_thread(api_.describe_processes, compat, process_id))
 
 
 @oapip.route('/jobs')
@@ -33,12 +35,12 @@ async def get_jobs(job_id=None):
     compat = CompatibilityRequest(None, request.headers, request.args)
 
     if job_id is None:
-        return await to_response(api_.get_jobs(compat))
+        return await to_response(await asyncio.to_thread(api_.get_jobs, compat))
     else:
         if request.method == 'DELETE':  # dismiss job
-            return await to_response(api_.delete_job(compat, job_id))
+            return await to_response(await asyncio.to_thread(api_.delete_job, compat, job_id))
         else:  # Return status of a specific job
-            return await to_response(api_.get_jobs(compat, job_id))
+            return await to_response(await asyncio.to_thread(api_.get_jobs, compat, job_id))
 
 
 @oapip.route('/processes/<process_id>/execution', methods=['POST'])
@@ -52,7 +54,7 @@ async def execute_process_jobs(process_id):
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
 
-    return await to_response(api_.execute_process(compat, process_id))
+    return await to_response(await asyncio.to_thread(api_.execute_process, compat, process_id))
 
 
 @oapip.route('/jobs/<job_id>/results',
@@ -66,7 +68,7 @@ async def get_job_result(job_id=None):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_job_result(compat, job_id))
+    return await to_response(await asyncio.to_thread(api_.get_job_result, compat, job_id))
 
 
 @oapip.route('/jobs/<job_id>/results/<resource>', methods=['GET'])
@@ -80,5 +82,5 @@ async def get_job_result_resource(job_id, resource):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_job_result_resource(
-        compat, job_id, resource))
+    return await to_response(await asyncio.to_thread(api_.get_job_result_resource,
+                                                     compat, job_id, resource))
@@ -1,3 +1,5 @@
+import asyncio
+
 from quart import Blueprint, request
 
 from pygeoapi.flask_app import api_
@@ -14,7 +16,7 @@ async def stac_catalog_root():
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_stac_root(compat))
+    return await to_response(await asyncio.to_thread(api_.get_stac_root, compat))
 
 
 @stac.route('/stac/<path:path>')
@@ -27,4 +29,4 @@ async def stac_catalog_path(path):
     :returns: HTTP response
     """
     compat = CompatibilityRequest(None, request.headers, request.args)
-    return await to_response(api_.get_stac_path(compat, path))
+    return await to_response(await asyncio.to_thread(api_.get_stac_path, compat, path))
@@ -1,5 +1,9 @@
+import asyncio
+
 from pygeoapi.flask_app import CONFIG, OPENAPI
-from api import *
+from pygeoapi.plugin import PLUGINS
+
+from api import CSAPI
 
 PLUGINS["provider"]["ElasticSearchConnectedSystems"] = \
     "provider.part1.elasticsearch.ConnectedSystemsESProvider"
@@ -9,22 +13,19 @@ PLUGINS["provider"]["TimescaleDBConnectedSystems"] = \
 csapi_ = CSAPI(CONFIG, OPENAPI)
 
 
+def _providers():
+    return [p for p in (csapi_.provider_part1, csapi_.provider_part2) if p]
+
+
 async def setup_db():
     """ Initialize persistent database/provider connections """
-    if csapi_.provider_part1:
-        await csapi_.provider_part1.open()
-        await csapi_.provider_part1.setup()
-    if csapi_.provider_part2:
-        await csapi_.provider_part2.open()
-        await csapi_.provider_part2.setup()
+    await asyncio.gather(*(p.open() for p in _providers()))
+    await asyncio.gather(*(p.setup() for p in _providers()))
 
 
 async def close_db():
     """ Clean exit database/provider connections """
-    if csapi_.provider_part1:
-        await csapi_.provider_part1.close()
-    if csapi_.provider_part2:
-        await csapi_.provider_part2.close()
+    await asyncio.gather(*(p.close() for p in _providers()))
 
 
 async def main():
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the application modules are imported relative to connected-systems-api, as the app does at runtime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
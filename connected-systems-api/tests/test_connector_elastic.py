@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import urllib.parse
+
+import orjson
+import pytest
+from elasticsearch_dsl import AsyncSearch
+from pygeoapi.provider.base import ProviderInvalidQueryError, ProviderQueryError
+
+from provider import connector_elastic
+from provider.connector_elastic import ElasticsearchConnector, MultiSearchBatcher, _decode_cursor, _encode_cursor
+from provider.definitions import SystemsParams, parse_query_parameters
+
+URL = "http://localhost:5000/systems"
+
+
+class _Query:
+    """ Stands in for an AsyncSearch, records the options the connector applies """
+
+    def __init__(self):
+        self.search_after = None
+        self.slice = None
+
+    def source(self, **kwargs):
+        return self
+
+    def sort(self, *keys):
+        return self
+
+    def extra(self, **kwargs):
+        self.search_after = kwargs.get("search_after", self.search_after)
+        return self
+
+    def params(self, **kwargs):
+        return self
+
+    def __getitem__(self, item: slice):
+        self.slice = item
+        return self
+
+
+class _Batcher:
+    """ Answers every search with the given hits, as far as the requested page reaches """
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    async def execute(self, query: _Query):
+        return {"hits": {"hits": self.hits[query.slice]}}
+
+
+def _hits(count: int):
+    return [{"_source": {"id": str(i)}, "sort": [1.0, str(i)]} for i in range(count)]
+
+
+def _search(hits, query: dict):
+    connector = ElasticsearchConnector()
+    connector._batcher = _Batcher(hits)
+    params = parse_query_parameters(SystemsParams(), query, URL)
+    return asyncio.run(connector.search(_Query(), params))
+
+
+def test_cursor_round_trip():
+    sort_values = [1.5, "system-1"]
+
+    assert _decode_cursor(_encode_cursor(sort_values)) == sort_values
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    "ä",
+    base64.urlsafe_b64encode(b"[1.0,").decode(),
+    base64.urlsafe_b64encode(orjson.dumps({"id": "a"})).decode(),
+    base64.urlsafe_b64encode(orjson.dumps([1.0, "a", "b"])).decode(),
+])
+def test_invalid_cursor_is_a_client_error(cursor):
+    with pytest.raises(ProviderInvalidQueryError):
+        _decode_cursor(cursor)
+
+
+def test_invalid_cursor_fails_before_searching():
+    with pytest.raises(ProviderInvalidQueryError):
+        _search(_hits(3), {"after": "not a cursor"})
+
+
+def test_search_links_next_page_when_more_hits_exist():
+    items, links = _search(_hits(6), {"limit": "5"})
+
+    assert [item["id"] for item in items] == ["0", "1", "2", "3", "4"]
+    assert [link["rel"] for link in links] == ["next"]
+    query = dict(urllib.parse.parse_qsl(links[0]["href"].partition("?")[2]))
+    assert _decode_cursor(query["after"]) == [1.0, "4"]
+
+
+def test_search_has_no_next_link_on_last_page():
+    items, links = _search(_hits(5), {"limit": "5"})
+
+    assert len(items) == 5
+    assert links == []
+
+
+class _Client:
+    """ Answers multi searches by index name, the errors map index names to the error response of their search """
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.requests = []
+
+    async def msearch(self, searches):
+        indices = [header["index"][0] for header in searches[::2]]
+        self.requests.append(indices)
+        return {"responses": [self.errors.get(index, {"hits": {"hits": [{"_index": index}]}}) for index in indices]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = _Client()
+    monkeypatch.setattr(connector_elastic.connections, "get_connection", lambda alias="default": client)
+    return client
+
+
+def _execute(batcher: MultiSearchBatcher, *indices: str, delay: float = 0):
+    async def run():
+        searches = []
+        for index in indices:
+            searches.append(asyncio.ensure_future(batcher.execute(AsyncSearch(index=index))))
+            if delay:
+                await asyncio.sleep(delay)
+        return await asyncio.wait_for(asyncio.gather(*searches, return_exceptions=True), 1)
+
+    return asyncio.run(run())
+
+
+def _index(response) -> str:
+    return response["hits"]["hits"][0]["_index"]
+
+
+def test_batcher_coalesces_concurrent_searches(client):
+    responses = _execute(MultiSearchBatcher(), "a", "b", "c")
+
+    assert client.requests == [["a", "b", "c"]]
+    assert [_index(response) for response in responses] == ["a", "b", "c"]
+
+
+def test_batcher_flushes_full_batch_without_waiting(client):
+    # the window would outlast the timeout, only a full batch is sent in time
+    responses = _execute(MultiSearchBatcher(flush_ms=10_000, max_batch=2), "a", "b")
+
+    assert client.requests == [["a", "b"]]
+    assert [_index(response) for response in responses] == ["a", "b"]
+
+
+def test_batcher_splits_at_max_batch(client):
+    _execute(MultiSearchBatcher(max_batch=2), "a", "b", "c")
+
+    assert client.requests == [["a", "b"], ["c"]]
+
+
+def test_batcher_collects_searches_within_window(client):
+    responses = _execute(MultiSearchBatcher(flush_ms=100), "a", "b", delay=0.01)
+
+    assert client.requests == [["a", "b"]]
+    assert [_index(response) for response in responses] == ["a", "b"]
+
+
+def test_batcher_fails_only_the_failed_search(client):
+    client.errors = {
+        "a": {"status": 400, "error": {"type": "search_phase_execution_exception", "reason": "all shards failed",
+                                       "root_cause": [{"type": "parse_exception", "reason": "bad query"}]}},
+        "c": {"status": 500, "error": {"type": "exception", "reason": "shard failure"}},
+    }
+
+    a, b, c = _execute(MultiSearchBatcher(), "a", "b", "c")
+
+    assert client.requests == [["a", "b", "c"]]
+    assert isinstance(a, ProviderInvalidQueryError) and a.user_msg == "bad query"
+    assert _index(b) == "b"
+    assert isinstance(c, ProviderQueryError) and not isinstance(c, ProviderInvalidQueryError)
+    assert c.user_msg == "shard failure"
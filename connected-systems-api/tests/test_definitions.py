@@ -0,0 +1,29 @@
+import dataclasses
+import urllib.parse
+
+from provider.definitions import SystemsParams, parse_query_parameters
+
+URL = "http://localhost:5000/systems"
+
+
+def _parse(query: dict) -> SystemsParams:
+    return parse_query_parameters(SystemsParams(), query, URL)
+
+
+def _follow(link: str) -> SystemsParams:
+    url, _, query = link.partition("?")
+    assert url == URL
+    return _parse(dict(urllib.parse.parse_qsl(query)))
+
+
+def test_nextlink_with_cursor_parses_to_same_parameters():
+    params = _parse({"id": "a,b", "q": "sensor", "bbox": "7.1,51.9,7.7,52.1", "parent": "p1",
+                     "datetime": "2024-01-01T00:00:00Z/..", "limit": "5", "f": "application/geo+json"})
+
+    assert _follow(params.nextlink("WzEuMCwiYSJd")) == dataclasses.replace(params, after="WzEuMCwiYSJd", offset=0)
+
+
+def test_nextlink_with_offset_parses_to_same_parameters():
+    params = _parse({"id": "a", "bbox": "1,2,0,3,4,10", "limit": "5", "offset": "10"})
+
+    assert _follow(params.nextlink()) == dataclasses.replace(params, offset=15)
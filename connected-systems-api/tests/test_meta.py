@@ -0,0 +1,57 @@
+import asyncio
+from http import HTTPStatus
+
+import orjson
+from quart import Quart, request
+
+from meta import CSMeta
+
+CONFIG = {
+    'server': {
+        'url': 'http://localhost:5000',
+        'languages': ['en-US'],
+        'encoding': 'utf-8',
+    },
+    'logging': {
+        'level': 'ERROR',
+    },
+    'resources': {},
+    'dynamic-resources': {},
+}
+
+CONFORMANCE_CLASSES = [
+    "http://www.opengis.net/spec/ogcapi-common-1/1.0/conf/core",
+]
+
+
+class _Provider:
+    @staticmethod
+    def get_conformance():
+        return CONFORMANCE_CLASSES
+
+
+def _conformance(query_string: dict):
+    meta = CSMeta(CONFIG, {})
+    meta.provider_part1 = _Provider()
+
+    async def get():
+        async with Quart(__name__).test_request_context('/conformance', query_string=query_string):
+            # set on csa routes only, read when parsing the request
+            request.collection = None
+            return await meta.conformance(request)
+
+    return asyncio.run(get())
+
+
+def test_conformance_returns_the_conformance_classes():
+    for query_string in ({}, {'f': 'json'}, {'f': 'application/json'}):
+        _, status, content = _conformance(query_string)
+
+        assert status == HTTPStatus.OK
+        assert orjson.loads(content) == {'conformsTo': CONFORMANCE_CLASSES}
+
+
+def test_conformance_rejects_unsupported_formats():
+    _, status, _ = _conformance({'f': 'application/sml+json'})
+
+    assert status == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+from http import HTTPStatus
+
+from pygeoapi import l10n
+from quart import Quart, request
+
+from util import DocumentCache
+
+LOCALES = l10n.get_locales({'server': {'languages': ['en-US', 'de']}})
+
+DOCUMENT = b'{"title": "document"}'
+
+
+class _Endpoint:
+    """ Builds the document of an endpoint and counts how often it is built """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.builds = 0
+
+    async def build(self):
+        self.builds += 1
+        return {'Content-Type': 'application/json'}, HTTPStatus.OK, DOCUMENT
+
+
+def _respond(cache: DocumentCache, *requests):
+    """
+    Sends the requests one after the other and returns the status, headers and content of each response.
+    A request is the endpoint and the keyword arguments of its request context.
+    """
+    app = Quart(__name__)
+
+    async def run():
+        responses = []
+        for endpoint, context in requests:
+            async with app.test_request_context('/', **context):
+                response = await cache.respond(endpoint.name, request, endpoint.build)
+                responses.append((response.status_code, response.headers, await response.get_data()))
+        return responses
+
+    return asyncio.run(run())
+
+
+def test_cached_document_is_not_built_again():
+    landing = _Endpoint('landing')
+
+    responses = _respond(DocumentCache(LOCALES), (landing, {}), (landing, {}))
+
+    assert landing.builds == 1
+    assert [content for _, _, content in responses] == [DOCUMENT, DOCUMENT]
+
+
+def test_least_recently_used_document_is_evicted():
+    landing, openapi, conformance = _Endpoint('landing'), _Endpoint('openapi'), _Endpoint('conformance')
+    cache = DocumentCache(LOCALES, size=2)
+
+    # the landing page is used again before the conformance page is stored, so the openapi document is evicted
+    _respond(cache, (landing, {}), (openapi, {}), (landing, {}), (conformance, {}))
+    assert len(cache) == 2
+    _respond(cache, (landing, {}), (openapi, {}))
+
+    assert (landing.builds, openapi.builds, conformance.builds) == (1, 2, 1)
+
+
+def test_matching_if_none_match_is_not_modified():
+    landing = _Endpoint('landing')
+    cache = DocumentCache(LOCALES)
+    (_, headers, _), = _respond(cache, (landing, {}))
+
+    (status, revalidated, content), = _respond(cache, (landing, {'headers': {'If-None-Match': headers['ETag']}}))
+
+    assert status == HTTPStatus.NOT_MODIFIED
+    assert revalidated['ETag'] == headers['ETag']
+    assert content == b''
+    assert landing.builds == 1
+
+
+def test_outdated_if_none_match_gets_the_document():
+    landing = _Endpoint('landing')
+
+    (status, _, content), = _respond(DocumentCache(LOCALES), (landing, {'headers': {'If-None-Match': '"outdated"'}}))
+
+    assert status == HTTPStatus.OK
+    assert content == DOCUMENT
+
+
+def test_gzip_and_plain_documents_are_separate_variants():
+    landing = _Endpoint('landing')
+    cache = DocumentCache(LOCALES, gzip_enabled=True)
+
+    (_, zipped_headers, zipped), (_, plain_headers, plain) = _respond(
+        cache, (landing, {'headers': {'Accept-Encoding': 'gzip, deflate'}}), (landing, {}))
+
+    assert landing.builds == 2
+    assert zipped_headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped) == DOCUMENT
+    assert 'Content-Encoding' not in plain_headers
+    assert plain == DOCUMENT
+    assert zipped_headers['ETag'] != plain_headers['ETag']
+
+
+def test_gzip_is_not_applied_when_disabled():
+    landing = _Endpoint('landing')
+
+    (_, headers, content), = _respond(DocumentCache(LOCALES), (landing, {'headers': {'Accept-Encoding': 'gzip'}}))
+
+    assert 'Content-Encoding' not in headers
+    assert content == DOCUMENT
+
+
+def test_locale_change_is_a_miss():
+    landing = _Endpoint('landing')
+
+    _respond(DocumentCache(LOCALES),
+             (landing, {'query_string': {'lang': 'en-US'}}),
+             (landing, {'query_string': {'lang': 'de'}}),
+             (landing, {'headers': {'Accept-Language': 'de'}}))
+
+    # the Accept-Language header negotiates the same locale as the lang parameter
+    assert landing.builds == 2
+
+
+def test_format_change_is_a_miss():
+    landing = _Endpoint('landing')
+
+    _respond(DocumentCache(LOCALES),
+             (landing, {'query_string': {'f': 'json'}}),
+             (landing, {'query_string': {'f': 'html'}}),
+             (landing, {'query_string': {'f': 'json'}}))
+
+    assert landing.builds == 2
@@ -1,11 +1,22 @@
+import base64
+import functools
+import gzip
+import hashlib
+from collections import OrderedDict
+from decimal import Decimal
 from enum import Enum
-from typing import Self, Union, Tuple, Optional
+from http import HTTPStatus
+from pathlib import PurePath
+from types import MappingProxyType
+from typing import Self, Union, Tuple, Optional, Iterable, Callable, Awaitable
 
+import orjson
 from pygeoapi import l10n
-from pygeoapi.api import APIRequest
-from quart import make_response
+from pygeoapi.api import APIRequest, FORMAT_TYPES, F_GZIP
+from quart import make_response, current_app
+from quart.json.provider import DefaultJSONProvider
 
-APIResponse = Tuple[dict | None, int, str]
+APIResponse = Tuple[dict | None, int, str | bytes | Iterable[bytes]]
 Path = Union[Tuple[str, str], None]
 
 
@@ -26,6 +37,24 @@ class ALLOWED_MIMES(Enum):
         return [cls.F_HTML.value, cls.F_JSON.value, cls.F_GEOJSON.value, cls.F_SMLJSON.value,
                 cls.F_OMJSON.value, cls.F_SWEJSON.value]
 
+    @functools.cached_property
+    def url_value(self) -> str:
+        """ value usable as query parameter, with the '+' of the media type percent-encoded """
+        return self.value.replace("+", "%2B")
+
+
+# media type of each negotiated format, csa media types are used as format directly
+CONTENT_TYPES = MappingProxyType({
+    **{mime: mime for mime in ALLOWED_MIMES.values()},
+    **FORMAT_TYPES,
+    F_GZIP: 'application/gzip',
+})
+
+
+@functools.cache
+def _format_values(formats: tuple[ALLOWED_MIMES, ...]) -> frozenset[str]:
+    return frozenset(f.value.lower() for f in formats)
+
 
 class AsyncAPIRequest(APIRequest):
     @classmethod
@@ -36,10 +65,8 @@ class AsyncAPIRequest(APIRequest):
             api_req.collection = request.collection
         return api_req
 
-    def is_valid(self, allowed_formats: Optional[list[str]] = None) -> bool:
-        if self._format in (f.value.lower() for f in (allowed_formats or ())):
-            return True
-        return False
+    def is_valid(self, allowed_formats: Optional[tuple[ALLOWED_MIMES, ...]] = None) -> bool:
+        return self._format in _format_values(tuple(allowed_formats or ()))
 
     def _get_format(self, headers) -> Union[str, None]:
         if f := super()._get_format(headers):
@@ -53,7 +80,7 @@ class AsyncAPIRequest(APIRequest):
                              force_encoding: str = None,
                              **custom_headers) -> dict:
         return {
-            'Content-Type': force_encoding if force_encoding else self._format,
+            'Content-Type': force_encoding if force_encoding else CONTENT_TYPES.get(self._format, self._format),
             # 'X-Powered-By': f'pygeoapi {__version__}',
         }
 
@@ -81,6 +108,58 @@ class CompatibilityRequest:
         self.args = args
 
 
+def _json_default(obj):
+    """
+    Serializes the types of pygeoapi's json_serial that orjson does not handle natively.
+    Dates, times and numpy types are serialized by orjson itself.
+    """
+    if isinstance(obj, bytes):
+        try:
+            return obj.decode('utf-8')
+        except UnicodeDecodeError:
+            # binary content is returned base64 encoded, like pygeoapi does
+            return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, l10n.Locale):
+        return l10n.locale2str(obj)
+    if isinstance(obj, PurePath):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# numpy values are serialized natively, like the numpy branches of pygeoapi's json_serial
+_DUMPS_OPTION = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(obj, pretty: bool = False) -> bytes:
+    """
+    Serializes an object to UTF-8 encoded JSON using orjson.
+    The bytes are passed to the response as is, without decoding to str and encoding again.
+
+    :param obj: object to serialize
+    :param pretty: whether to indent the output
+
+    :returns: JSON bytes
+    """
+    option = _DUMPS_OPTION | (orjson.OPT_INDENT_2 if pretty else 0)
+    return orjson.dumps(obj, default=_json_default, option=option)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """ JSON provider serializing with orjson instead of the stdlib json module """
+    option = _DUMPS_OPTION
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dump_bytes(obj).decode()
+
+    def dump_bytes(self, obj) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self.option)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 async def to_response(result: APIResponse):
     """
     Creates a Quart Response object and updates matching headers.
@@ -90,4 +169,79 @@ async def to_response(result: APIResponse):
 
     :returns: A Response instance.
     """
-    return await make_response(result[2], result[1], result[0])
+    headers, status, content = result
+    if isinstance(content, (dict, list)):
+        # serialize to bytes directly, skipping the str round trip of the provider's dumps
+        content = current_app.json.dump_bytes(content)
+        headers = headers or {}
+        headers.setdefault('Content-Type', 'application/json')
+    return await make_response(content, status, headers)
+
+
+class DocumentCache:
+    """
+    Responses of documents that only change with the configuration, kept per endpoint and negotiated variant.
+    The least recently used document is evicted first.
+    """
+
+    def __init__(self, locales, gzip_enabled: bool = False, encoding: str = 'utf-8', size: int = 128):
+        self._documents = OrderedDict()
+        self._locales = locales
+        self._gzip = gzip_enabled
+        self._encoding = encoding
+        self._size = size
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _variant(self, endpoint: str, request) -> tuple:
+        # keyed on the outcome of the negotiation, clients send many different headers for the same variant
+        negotiated = AsyncAPIRequest(CompatibilityRequest(None, request.headers, request.args), self._locales)
+        gzipped = self._gzip and 'gzip' in request.headers.get('Accept-Encoding', '')
+        # 'ui' selects the html renderer of the openapi document
+        return endpoint, negotiated.format, str(negotiated.locale), gzipped, request.args.get('ui')
+
+    def _store(self, key: tuple, response: APIResponse) -> APIResponse:
+        headers, status, content = response
+        if status != HTTPStatus.OK:
+            return response
+        if isinstance(content, (str, bytes)):
+            headers = dict(headers or {})
+            if isinstance(content, str):
+                content = content.encode(self._encoding)
+            # compress once when storing instead of on every request, unless done by pygeoapi already
+            gzipped = key[3]
+            if gzipped and 'Content-Encoding' not in headers:
+                headers.update({'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+                content = gzip.compress(content)
+            # the documents are byte stable, so clients can revalidate them with If-None-Match
+            headers['ETag'] = f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+            response = (headers, status, content)
+        self._documents[key] = response
+        if len(self._documents) > self._size:
+            self._documents.popitem(last=False)
+        return response
+
+    async def respond(self, endpoint: str, request, build: Callable[[], Awaitable[APIResponse]]):
+        """
+        Responds with the cached document of the negotiated variant, building it on a miss.
+        Clients revalidating the document with its ETag get a 304 without content.
+
+        :param endpoint: name of the endpoint
+        :param request: the request
+        :param build: function returning the awaitable response of the endpoint
+
+        :returns: A Response instance.
+        """
+        key = self._variant(endpoint, request)
+        response = self._documents.get(key)
+        if response is None:
+            response = self._store(key, await build())
+        else:
+            self._documents.move_to_end(key)
+
+        headers = response[0]
+        etag = headers.get('ETag') if headers else None
+        if etag and request.if_none_match.contains(etag.strip('"')):
+            return await to_response(({'ETag': etag}, HTTPStatus.NOT_MODIFIED, b''))
+        return await to_response(response)
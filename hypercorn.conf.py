@@ -13,10 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =================================================================
+import os
+
 bind = '0.0.0.0:5000'
 backlog = 2048
 
-workers = 4
+# one event loop, and one set of provider connection pools, per worker process
+workers = int(os.getenv('HYPERCORN_WORKERS', 4))
 worker_class = 'uvloop'
 worker_connections = 1000
 timeout = 30